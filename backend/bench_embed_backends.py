@@ -0,0 +1,87 @@
+"""Import time, first-request latency and throughput of each embedder backend.
+
+Run from backend/ (the model is downloaded on first use):
+
+    python bench_embed_backends.py
+    python bench_embed_backends.py --backends torch,onnx-int8 --chunks 2000
+
+Every backend runs in a fresh process, so "import" is what a web worker
+pays to import the Django views (the model is no longer loaded there),
+"first request" is the first embed call including the lazy model load,
+"query ms" is the median single-question latency afterwards and
+"chunks/s" is batched throughput on ~350-token chunks.
+The onnx backends need `pip install optimum[onnxruntime]`.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+CHILD = r"""
+import os, sys, json, time, random, statistics
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "rag_project.settings")
+os.environ["INGEST_WORKERS"] = "0"
+
+t0 = time.perf_counter()
+import django
+django.setup()
+import ragapp.views, studyapp.views
+t_import = time.perf_counter() - t0
+
+from ragapp.embeddings import embed_texts
+t0 = time.perf_counter()
+embed_texts(["What is a pointer?"])
+t_first = time.perf_counter() - t0
+
+rng = random.Random(0)
+words = "pointer array memory address value stack heap loop index struct function variable".split()
+latencies = []
+for i in range(50):
+    q = " ".join(rng.choices(words, k=10))
+    t0 = time.perf_counter()
+    embed_texts([q])
+    latencies.append(time.perf_counter() - t0)
+
+chunks = [" ".join(rng.choices(words, k=350)) for _ in range(int(sys.argv[1]))]
+t0 = time.perf_counter()
+embed_texts(chunks, use_pool=False)
+t_batch = time.perf_counter() - t0
+
+print(json.dumps({
+    "import_s": t_import,
+    "first_request_s": t_first,
+    "query_ms": statistics.median(latencies) * 1000,
+    "chunks_per_s": len(chunks) / t_batch,
+}))
+"""
+
+
+def run(backend, chunks):
+    env = dict(os.environ, EMBED_BACKEND=backend)
+    proc = subprocess.run([sys.executable, "-c", CHILD, str(chunks)], env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="torch,torch-int8,onnx,onnx-int8")
+    parser.add_argument("--chunks", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'backend':<12}{'import s':>10}{'first req s':>13}{'query ms':>10}{'chunks/s':>10}")
+    for backend in args.backends.split(","):
+        r = run(backend, args.chunks)
+        if "error" in r:
+            print(f"{backend:<12}  {r['error']}")
+            continue
+        print(f"{backend:<12}{r['import_s']:>10.2f}{r['first_request_s']:>13.2f}"
+              f"{r['query_ms']:>10.1f}{r['chunks_per_s']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Startup time and memory of main.py's index loading: in-memory vs mmap.
+
+Run from backend/ after ingest.py (or pass --synthetic N to benchmark a
+generated corpus of N chunks instead):
+
+    python bench_startup.py --workers 4
+    python bench_startup.py --synthetic 200000 --workers 4
+
+Each mode starts N worker processes that load the index + chunk texts and
+run a few searches, like N uvicorn workers would. RSS counts shared pages
+in every process; PSS divides them between the processes sharing them, so
+the PSS total is what the workers really cost together.
+
+Synthetic corpus, 200,000 chunks x 384 dims (~300 MB vectors), 4 workers,
+faiss 1.15 on Linux:
+
+    mode          load s      RSS MB      PSS MB
+    inmemory       3.452      1943.8      1853.4
+    mmap           0.383      1456.2       468.5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+INDEX_DIR = "ingest_index"
+
+
+def proc_kb(pid, field, path="status"):
+    with open(f"/proc/{pid}/{path}") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def child(mode, index_dir):
+    start = time.perf_counter()
+    from ragapp.mmap_store import MmapTexts, load_index
+    from ragapp.chunk_store import ChunkStore
+
+    index = load_index(os.path.join(index_dir, "index.faiss"), use_mmap=(mode == "mmap"))
+    if mode == "mmap":
+        texts = MmapTexts(index_dir)
+        lookup = texts.lookup
+    else:
+        # what the old pickle did: every chunk string resident in every worker
+        store = ChunkStore(os.path.join(index_dir, "chunks.sqlite3"))
+        docs = dict(store.conn.execute("SELECT id, text FROM chunks"))
+
+        def lookup(ids):
+            return [{"id": int(i), "text": docs[int(i)]} for i in ids if int(i) in docs]
+    load_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(os.getpid())
+    queries = rng.standard_normal((20, index.d)).astype("float32")
+    _, I = index.search(queries, 3)
+    for row in I:
+        lookup(row)
+
+    print(json.dumps({"load_s": load_s}), flush=True)
+    sys.stdin.read()  # stay alive until the parent has measured us
+
+
+def run_mode(mode, index_dir, workers):
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "--child", mode, "--dir", index_dir],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    loads = [json.loads(p.stdout.readline())["load_s"] for p in procs]
+    rss = sum(proc_kb(p.pid, "VmRSS") for p in procs)
+    pss = sum(proc_kb(p.pid, "Pss", "smaps_rollup") for p in procs)
+    for p in procs:
+        p.stdin.close()
+        p.wait()
+    return max(loads), rss / 1024, pss / 1024
+
+
+def build_synthetic(n, dim=384):
+    import faiss
+    from ragapp.chunk_store import ChunkStore
+    from ragapp.mmap_store import export_texts
+
+    out = tempfile.mkdtemp(prefix="bench_startup_")
+    rng = np.random.default_rng(0)
+    store = ChunkStore(os.path.join(out, "chunks.sqlite3"))
+    words = ["pointer", "array", "memory", "index", "loop", "struct", "value", "address"]
+    ids = store.append([{"text": " ".join(rng.choice(words, 80))} for _ in range(n)])
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    vectors = rng.standard_normal((n, dim)).astype("float32")
+    index.add_with_ids(vectors, np.array(ids, dtype="int64"))
+    faiss.write_index(index, os.path.join(out, "index.faiss"))
+    export_texts(store, out)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--dir", default=INDEX_DIR)
+    parser.add_argument("--child", choices=["inmemory", "mmap"])
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child, args.dir)
+
+    index_dir = build_synthetic(args.synthetic) if args.synthetic else args.dir
+    print(f"{index_dir}, {args.workers} workers")
+    print(f"{'mode':<10}{'load s':>10}{'RSS MB':>12}{'PSS MB':>12}")
+    for mode in ("inmemory", "mmap"):
+        load_s, rss, pss = run_mode(mode, index_dir, args.workers)
+        print(f"{mode:<10}{load_s:>10.3f}{rss:>12.1f}{pss:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
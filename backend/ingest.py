@@ -1,61 +1,147 @@
 import os
+import json
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-from sentence_transformers import SentenceTransformer
 import faiss
-import pickle
+import numpy as np
 
-# Load environment variables
+# Load environment variables (before ragapp, which reads EMBED_* on import)
 load_dotenv()
 print("✅ Loaded .env")
 
+from ragapp.embeddings import EMB_DIM, embed_texts
+from ragapp.chunk_store import ChunkStore
+from ragapp.hashing import file_sha256
+from ragapp.pdf_text import iter_extract
+from ragapp.chunking import iter_chunks
+from ragapp.mmap_store import export_texts
+
 # Paths
 DOCS_DIR = "docs"
-INDEX_FILE = "faiss_index.pkl"
+OUT_DIR = "ingest_index"
+INDEX_FILE = os.path.join(OUT_DIR, "index.faiss")
+CHUNKS_FILE = os.path.join(OUT_DIR, "chunks.sqlite3")
+MANIFEST_FILE = os.path.join(OUT_DIR, "manifest.json")
+
+
+def atomic_write(path, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def load_index():
+    if os.path.exists(INDEX_FILE):
+        return faiss.read_index(INDEX_FILE)
+    # embeddings are L2-normalized, so L2 ranking == cosine ranking
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(EMB_DIM))
+
+
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+
+def save_manifest(manifest):
+    def write(p):
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
 
-# Load local embedding model
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+    atomic_write(MANIFEST_FILE, write)
 
-# Create FAISS index
-dimension = 384  # embedding size of MiniLM
-index = faiss.IndexFlatL2(dimension)
-documents = []
 
+def save_index(index):
+    atomic_write(INDEX_FILE, lambda p: faiss.write_index(index, p))
 
-def extract_text_from_pdf(path):
-    reader = PdfReader(path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
 
+def drop_entry(index, store, entry):
+    """Remove a file's vectors and chunks (no-op for ids that were never added)."""
+    ids = entry.get("ids", [])
+    if ids:
+        index.remove_ids(np.array(ids, dtype="int64"))
+        store.remove(ids)
 
-def split_text(text, chunk_size=500, overlap=50):
-    """Split text into overlapping chunks"""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    return chunks
 
+def ingest():
+    os.makedirs(OUT_DIR, exist_ok=True)
+    index = load_index()
+    store = ChunkStore(CHUNKS_FILE)
+    manifest = load_manifest()
+    files = manifest["files"]
 
-# Ingest all PDFs
-for filename in os.listdir(DOCS_DIR):
-    if filename.endswith(".pdf"):
+    # Resume: a crash between writing chunks and saving the index leaves
+    # "pending" entries; roll them back so the file is re-ingested cleanly
+    for name, entry in list(files.items()):
+        if entry.get("status") != "done":
+            print(f"↩️  Rolling back interrupted ingest of {name}")
+            drop_entry(index, store, entry)
+            del files[name]
+    # A crash after store.append() but before the "pending" entry was saved
+    # leaves chunks no entry knows about; sweep them too
+    if all("ids" in entry for entry in files.values()):
+        referenced = {i for entry in files.values() for i in entry["ids"]}
+        orphans = [i for i in store.live_ids().tolist() if i not in referenced]
+        if orphans:
+            print(f"↩️  Removing {len(orphans)} chunks left by an interrupted ingest")
+            drop_entry(index, store, {"ids": orphans})
+    save_index(index)
+    save_manifest(manifest)
+
+    present = {f for f in os.listdir(DOCS_DIR) if f.endswith(".pdf")}
+
+    # Files removed from docs/
+    for name in sorted(set(files) - present):
+        print(f"🗑️  Removing {name}")
+        drop_entry(index, store, files.pop(name))
+        save_index(index)
+        save_manifest(manifest)
+
+    added = 0
+    for filename in sorted(present):
         path = os.path.join(DOCS_DIR, filename)
+        st = os.stat(path)
+        entry = files.get(filename)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            continue
+        digest = file_sha256(path)
+        if entry and entry["sha256"] == digest:
+            entry["mtime_ns"] = st.st_mtime_ns
+            save_manifest(manifest)
+            continue
+
         print(f"📄 Processing {filename}")
-        text = extract_text_from_pdf(path)
-        chunks = split_text(text)
+        if entry:
+            drop_entry(index, store, entry)
+
+        # Sentence-aware chunks, streamed page by page
+        chunks = list(iter_chunks(enumerate(iter_extract(path), 1)))
+
+        # Embed chunks (batched, pooled for large documents)
+        embeddings = embed_texts([c.text for c in chunks])
+        ids = store.append([
+            {"text": c.text, "file": filename, "source": "docs",
+             "page_start": c.page_start, "page_end": c.page_end}
+            for c in chunks
+        ])
+
+        # Record the ids before touching the index so a crash can be rolled back
+        files[filename] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest,
+                           "ids": ids, "status": "pending"}
+        save_manifest(manifest)
+
+        if ids:
+            index.add_with_ids(embeddings, np.array(ids, dtype="int64"))
+        save_index(index)
+        files[filename]["status"] = "done"
+        save_manifest(manifest)
+        added += len(chunks)
+
+    # Flat text blob + offsets for memory-mapped serving in main.py
+    export_texts(store, OUT_DIR)
 
-        # Embed chunks
-        embeddings = embedder.encode(chunks)
-        index.add(embeddings)
-        documents.extend(chunks)
+    print("✅ Ingestion complete! Added", added, "chunks; index holds", index.ntotal, "chunks.")
 
-# Save FAISS index + documents
-with open(INDEX_FILE, "wb") as f:
-    pickle.dump((index, documents), f)
 
-print("✅ Ingestion complete! Indexed", len(documents), "chunks.")
+if __name__ == "__main__":
+    ingest()
@@ -1,42 +1,61 @@
 import os
-import pickle
-import faiss
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
 
-# Load env
+# Load env first: the ragapp modules read GEMINI_*, EMBED_* and RAG_BATCH_*
+# settings when they are imported
 load_dotenv()
+
+from ragapp.chunk_store import ChunkStore
+from ragapp.mmap_store import MmapTexts, load_index
+from ragapp.microbatch import MicroBatcher
+from ragapp.embeddings import embed_texts
+from ragapp.llm_client import RateLimited, client as gemini, configure
+
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     raise ValueError("❌ GOOGLE_API_KEY missing in .env")
 
-genai.configure(api_key=GOOGLE_API_KEY)
+configure(api_key=GOOGLE_API_KEY)
 
-# Load FAISS index
-with open("faiss_index.pkl", "rb") as f:
-    index, documents = pickle.load(f)
-
-# Load embedder
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+# Load FAISS index + chunk text written by ingest.py. With MMAP_INDEX=1 (default)
+# both are memory-mapped, so uvicorn workers share one copy via the page cache
+# and startup no longer reads the whole corpus.
+INDEX_DIR = "ingest_index"
+USE_MMAP = os.getenv("MMAP_INDEX", "1") == "1"
+index = load_index(os.path.join(INDEX_DIR, "index.faiss"), use_mmap=USE_MMAP)
+if USE_MMAP:
+    chunk_store = MmapTexts(INDEX_DIR)
+else:
+    chunk_store = ChunkStore(os.path.join(INDEX_DIR, "chunks.sqlite3"))
 
 app = FastAPI()
 
 class Query(BaseModel):
     question: str
 
+def embed_and_search(questions):
+    # ingest.py stores normalized embeddings; the model loads on the first request
+    q_emb = embed_texts(questions, batch_size=len(questions))
+    D, I = index.search(q_emb, 3)  # top 3 results
+    return list(I)
+
+# concurrent /ask requests (FastAPI runs sync endpoints on a threadpool)
+# share one encode() and one index.search()
+retriever = MicroBatcher(embed_and_search, name="ask-retriever")
+
 @app.post("/ask")
 def ask(query: Query):
-    q_emb = embedder.encode([query.question])
-    D, I = index.search(q_emb, 3)  # top 3 results
-    retrieved_docs = [documents[i] for i in I[0]]
+    ids = retriever.submit(query.question)
+    retrieved_docs = [item["text"] for item in chunk_store.lookup(ids)]
 
     context = "\n".join(retrieved_docs)
     prompt = f"Answer the question using the context:\n\n{context}\n\nQ: {query.question}\nA:"
 
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(prompt)
+    try:
+        answer = gemini.generate(prompt, "gemini-1.5-flash", {})
+    except RateLimited as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-    return {"answer": response.text, "context": retrieved_docs}
+    return {"answer": answer, "context": retrieved_docs}
@@ -103,12 +103,58 @@ WSGI_APPLICATION = 'rag_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) or postgres. Connections are kept open for
+# DB_CONN_MAX_AGE seconds instead of being reopened on every request.
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+
+if DB_ENGINE == "postgres":
+    # needs psycopg 3 (`pip install "psycopg[binary,pool]"`)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("POSTGRES_DB", "rag_project"),
+            'USER': os.getenv("POSTGRES_USER", "postgres"),
+            'PASSWORD': os.getenv("POSTGRES_PASSWORD", ""),
+            'HOST': os.getenv("POSTGRES_HOST", "localhost"),
+            'PORT': os.getenv("POSTGRES_PORT", "5432"),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if os.getenv("DB_POOL", "1") == "1":
+        # a psycopg connection pool per process; Django requires
+        # CONN_MAX_AGE = 0 with it (the pool keeps the connections)
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            'max_size': int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            'timeout': float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("SQLITE_PATH", BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # seconds a writer waits for the lock before "database is locked"
+                'timeout': float(os.getenv("SQLITE_TIMEOUT", "20")),
+                # take the write lock when a transaction starts, so concurrent
+                # writers queue on the timeout instead of failing on upgrade
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+    if os.getenv("SQLITE_WAL", "1") == "1":
+        # readers no longer block on writers (and vice versa)
+        DATABASES['default']['OPTIONS']['init_command'] = (
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+        )
 
 
 # Password validation
@@ -6,6 +6,7 @@ from django.conf.urls.static import static
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/study/", include("studyapp.urls")),
+    path("api/", include("ragapp.urls")),
 ]
 
 if settings.DEBUG:
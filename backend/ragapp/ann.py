@@ -0,0 +1,150 @@
+# ragapp/ann.py
+# Index types for the RAG vector store and the flat -> ANN promotion policy.
+import os
+import math
+
+import faiss
+import numpy as np
+
+# target index type once the corpus is large enough: "flat" (never promote), "ivf" or "hnsw"
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "ivf")
+# number of vectors at which a flat index is rebuilt as RAG_INDEX_TYPE
+RAG_ANN_PROMOTE_AT = int(os.getenv("RAG_ANN_PROMOTE_AT", "20000"))
+
+# default per-query search knobs (overridable per request)
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+
+
+def new_flat_index(dim):
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+def index_kind(index):
+    """Return "flat", "ivf" or "hnsw" for an index (IndexIDMap2-wrapped or a bare IVF)."""
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def default_nlist(n):
+    # ~4*sqrt(n) lists, but keep >= 39 training points per list as faiss recommends
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _ivf_contents(ivf):
+    """(stored ids, vectors) of an IndexIVFFlat, read from its inverted lists.
+    make_direct_map() would need the ids to be sequential, which they stop
+    being after any removal."""
+    invlists = ivf.invlists
+    ids, vectors = [], []
+    for list_no in range(ivf.nlist):
+        n = invlists.list_size(list_no)
+        if not n:
+            continue
+        ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), n).copy())
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), n * invlists.code_size)
+        vectors.append(codes.view("float32").reshape(n, ivf.d).copy())
+    if not ids:
+        return np.zeros(0, dtype="int64"), np.zeros((0, ivf.d), dtype="float32")
+    return np.concatenate(ids).astype("int64"), np.vstack(vectors)
+
+
+def all_vectors(index):
+    """Return (ids, vectors) currently stored in an index."""
+    if not hasattr(index, "id_map"):
+        # IVF indexes store the external ids in their inverted lists
+        ids, vectors = _ivf_contents(faiss.downcast_index(index))
+        return ids, np.ascontiguousarray(vectors, dtype="float32")
+    id_map = faiss.vector_to_array(index.id_map).astype("int64")
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF):
+        # IVF indexes written before IVF was built unwrapped
+        positions, vectors = _ivf_contents(inner)
+        return id_map[positions], np.ascontiguousarray(vectors, dtype="float32")
+    vectors = inner.reconstruct_n(0, inner.ntotal) if inner.ntotal else np.zeros((0, index.d), dtype="float32")
+    return id_map, np.ascontiguousarray(vectors, dtype="float32")
+
+
+def build_index(kind, dim, vectors, ids, nlist=None):
+    """Build (and train, for IVF) a fresh index of the given kind holding vectors/ids.
+    Flat and HNSW are wrapped in an IndexIDMap2; IVF stores the ids itself."""
+    if kind == "flat":
+        index = new_flat_index(dim)
+    elif kind == "ivf":
+        nlist = nlist or default_nlist(len(vectors))
+        quantizer = faiss.IndexFlatIP(dim)
+        inner = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        inner.train(vectors)
+        inner.nprobe = min(IVF_NPROBE, nlist)
+        # no IndexIDMap2: IVF keeps the external ids in its lists, and the
+        # wrapper's remove_ids() would misnumber them (IVF doesn't renumber)
+        index = inner
+    elif kind == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+        index = faiss.IndexIDMap2(inner)
+    else:
+        raise ValueError(f"unknown index type: {kind}")
+
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def remove_ids(index, ids):
+    """Remove vectors by id; returns how many were removed. HNSW graphs do not
+    support removal, and IVF indexes wrapped in an IndexIDMap2 cannot remove
+    correctly, so those stay until the next compact() (the chunk store
+    filters them out as tombstones meanwhile)."""
+    kind = index_kind(index)
+    if kind == "hnsw" or (kind == "ivf" and hasattr(index, "id_map")) or not len(ids):
+        return 0
+    return int(index.remove_ids(np.asarray(ids, dtype="int64")))
+
+
+def compact(index, live_ids):
+    """Rebuild an index of the same type holding only the vectors in live_ids.
+    Returns (index, number of vectors dropped)."""
+    ids, vectors = all_vectors(index)
+    keep = np.isin(ids, live_ids)
+    kind = index_kind(index) if keep.any() else "flat"
+    return build_index(kind, index.d, vectors[keep], ids[keep]), int((~keep).sum())
+
+
+def maybe_promote(index):
+    """Rebuild a flat index as RAG_INDEX_TYPE once it passes RAG_ANN_PROMOTE_AT vectors."""
+    if RAG_INDEX_TYPE == "flat" or index_kind(index) != "flat" or index.ntotal < RAG_ANN_PROMOTE_AT:
+        return index
+    ids, vectors = all_vectors(index)
+    return build_index(RAG_INDEX_TYPE, index.d, vectors, ids)
+
+
+def search_params(index, nprobe=None, ef_search=None, ids=None):
+    """faiss SearchParameters for one query, or None to use the index defaults.
+
+    `ids` restricts results to those external ids (an IDSelectorBatch).
+    """
+    kind = index_kind(index)
+    kwargs = {}
+    if ids is not None:
+        kwargs["sel"] = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype="int64"))
+    if kind == "ivf" and (nprobe or kwargs):
+        kwargs["nprobe"] = int(nprobe or faiss.extract_index_ivf(index).nprobe)
+        params = faiss.SearchParametersIVF(**kwargs)
+    elif kind == "hnsw" and (ef_search or kwargs):
+        kwargs["efSearch"] = int(ef_search or faiss.downcast_index(index.index).hnsw.efSearch)
+        params = faiss.SearchParametersHNSW(**kwargs)
+    elif kwargs:
+        params = faiss.SearchParameters(**kwargs)
+    else:
+        return None
+    # the params only hold a raw pointer to the selector
+    params.sel_ref = kwargs.get("sel")
+    return params
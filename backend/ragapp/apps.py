@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RagappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ragapp'
+
+    def ready(self):
+        # connects the token cache invalidation signals
+        from . import auth  # noqa: F401
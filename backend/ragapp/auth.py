@@ -0,0 +1,62 @@
+# ragapp/auth.py
+import os
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from rest_framework.authtoken.models import Token
+
+from .query_cache import TTLCache
+
+# token key -> user, so authenticated requests skip the token/user queries.
+# Saving or deleting a token or its user evicts it in this process; other
+# worker processes see the change once their entry expires after the TTL.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+
+# helper: get user from Authorization header "Token <token>"
+def user_from_request(request):
+    auth = request.META.get("HTTP_AUTHORIZATION")
+    if not auth:
+        return None
+    parts = auth.split()
+    if len(parts) != 2 or parts[0].lower() != "token":
+        return None
+    token_key = parts[1]
+    user = token_cache.get(token_key)
+    if user is not None:
+        return user
+    try:
+        # one query for the token and its user
+        token = Token.objects.select_related("user").get(key=token_key)
+    except Token.DoesNotExist:
+        # unknown keys are not cached: they'd push out valid ones
+        return None
+    if not token.user.is_active:
+        return None
+    token_cache.set(token_key, token.user)
+    return token.user
+
+
+def invalidate_token(key):
+    token_cache.pop(key)
+
+
+def invalidate_user(user_id):
+    return token_cache.evict(lambda user: user.pk == user_id)
+
+
+# -------- Invalidation (logout, password change, token rotation) --------
+def _token_changed(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+def _user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+post_save.connect(_token_changed, sender=Token, dispatch_uid="ragapp.auth.token_saved")
+post_delete.connect(_token_changed, sender=Token, dispatch_uid="ragapp.auth.token_deleted")
+post_save.connect(_user_changed, sender=User, dispatch_uid="ragapp.auth.user_saved")
+post_delete.connect(_user_changed, sender=User, dispatch_uid="ragapp.auth.user_deleted")
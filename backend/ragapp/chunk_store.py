@@ -0,0 +1,425 @@
+# ragapp/chunk_store.py
+import os
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+from .hashing import text_sha256
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS chunks ("
+    " id INTEGER PRIMARY KEY,"
+    " text TEXT NOT NULL,"
+    " source TEXT,"
+    " file TEXT)",
+    # one row per upload; duplicate uploads get their own row but share chunks
+    "CREATE TABLE IF NOT EXISTS documents ("
+    " id INTEGER PRIMARY KEY,"
+    " file_hash TEXT NOT NULL,"
+    " file TEXT,"
+    " source TEXT,"
+    " created_at TEXT DEFAULT CURRENT_TIMESTAMP)",
+    "CREATE INDEX IF NOT EXISTS documents_file_hash ON documents (file_hash)",
+    "CREATE TABLE IF NOT EXISTS document_chunks ("
+    " document_id INTEGER NOT NULL,"
+    " chunk_id INTEGER NOT NULL,"
+    " PRIMARY KEY (document_id, chunk_id))",
+    "CREATE INDEX IF NOT EXISTS document_chunks_chunk ON document_chunks (chunk_id)",
+    # persistent embedding cache keyed by chunk content hash
+    "CREATE TABLE IF NOT EXISTS embeddings ("
+    " chunk_hash TEXT PRIMARY KEY,"
+    " vector BLOB NOT NULL)",
+    # high-water marks, so ids are never reused after chunks are purged
+    "CREATE TABLE IF NOT EXISTS counters ("
+    " name TEXT PRIMARY KEY,"
+    " value INTEGER NOT NULL)",
+]
+
+# columns added after the first release of each table
+ADDED_COLUMNS = {
+    "chunks": {
+        "chunk_hash": "TEXT",
+        "page_start": "INTEGER",
+        "page_end": "INTEGER",
+        # tombstone: set when the last document using the chunk is deleted
+        "deleted_at": "TEXT",
+        # set while an upload's vectors are not in the index yet
+        "pending": "INTEGER",
+    },
+    "documents": {
+        "owner_id": "INTEGER",
+    },
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS chunks_chunk_hash ON chunks (chunk_hash)",
+    "CREATE INDEX IF NOT EXISTS documents_owner ON documents (owner_id)",
+    "CREATE INDEX IF NOT EXISTS documents_source ON documents (source)",
+    "CREATE INDEX IF NOT EXISTS documents_file ON documents (file)",
+]
+
+LIVE = "deleted_at IS NULL"
+# live and already in the index, so other uploads may reuse the chunk
+INDEXED = f"{LIVE} AND pending IS NULL"
+
+# keep IN (...) lists under SQLite's host-parameter limit
+_BATCH = 500
+
+
+def _batches(seq):
+    seq = list(seq)
+    for i in range(0, len(seq), _BATCH):
+        yield seq[i:i + _BATCH]
+
+
+ITEM_COLUMNS = "id, text, source, file, page_start, page_end"
+
+
+def _row_to_item(row):
+    return {"id": row[0], "text": row[1], "source": row[2], "file": row[3],
+            "page_start": row[4], "page_end": row[5]}
+
+
+class ChunkStore:
+    """Chunk text/metadata keyed by FAISS id, stored in SQLite.
+
+    Writes are appends (one INSERT per chunk in a single transaction) and
+    reads are primary-key lookups, so neither upload cost nor per-query memory
+    depends on the size of the corpus. Replaces the old monolithic meta.json.
+
+    Chunks are also indexed by content hash so re-uploaded documents and
+    repeated chunks map onto existing vectors instead of adding new ones.
+    """
+
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        self.legacy_json = legacy_json
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    # --- connection handling ---
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        if not self._initialized:
+            self._initialize(conn)
+        return conn
+
+    def _initialize(self, conn):
+        with self._init_lock:
+            if self._initialized:
+                return
+            with conn:
+                for stmt in SCHEMA:
+                    conn.execute(stmt)
+                for table, columns in ADDED_COLUMNS.items():
+                    have = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+                    for column, decl in columns.items():
+                        if column not in have:
+                            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+                for stmt in INDEXES:
+                    conn.execute(stmt)
+            self._initialized = True
+        if self.legacy_json and os.path.exists(self.legacy_json):
+            self.import_meta_json(self.legacy_json)
+        self._backfill_hashes()
+
+    def _backfill_hashes(self):
+        conn = self.conn
+        rows = conn.execute("SELECT id, text FROM chunks WHERE chunk_hash IS NULL").fetchall()
+        if rows:
+            with conn:
+                conn.executemany(
+                    "UPDATE chunks SET chunk_hash = ? WHERE id = ?",
+                    [(text_sha256(text), _id) for _id, text in rows],
+                )
+
+    # --- writes ---
+    def append(self, items, pending=False):
+        """Insert items ({"text", "source", "file"}, optionally "page_start"/"page_end")
+        and return their new ids. Pending chunks are not reused by
+        ids_for_hashes() until mark_indexed()."""
+        conn = self.conn
+        ids = []
+        with conn:
+            # IMMEDIATE takes the write lock up front so concurrent workers
+            # never hand out the same ids
+            conn.execute("BEGIN IMMEDIATE")
+            (next_id,) = conn.execute(
+                "SELECT MAX(COALESCE((SELECT MAX(id) FROM chunks), 0),"
+                " COALESCE((SELECT value FROM counters WHERE name = 'chunk_id'), 0)) + 1"
+            ).fetchone()
+            rows = []
+            for item in items:
+                chunk_hash = item.get("chunk_hash") or text_sha256(item["text"])
+                rows.append((next_id, item["text"], item.get("source"), item.get("file"), chunk_hash,
+                             item.get("page_start"), item.get("page_end"), 1 if pending else None))
+                ids.append(next_id)
+                next_id += 1
+            conn.executemany(
+                "INSERT INTO chunks (id, text, source, file, chunk_hash, page_start, page_end, pending)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if ids:
+                conn.execute(
+                    "INSERT INTO counters (name, value) VALUES ('chunk_id', ?)"
+                    " ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                    (ids[-1],),
+                )
+        return ids
+
+    def mark_indexed(self, ids):
+        """Clear the pending flag once the chunks' vectors are in the index."""
+        conn = self.conn
+        with conn:
+            for batch in _batches(int(i) for i in ids):
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"UPDATE chunks SET pending = NULL WHERE id IN ({placeholders})", batch)
+
+    def add_document(self, file_hash, file, source, chunk_ids, owner_id=None):
+        conn = self.conn
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO documents (file_hash, file, source, owner_id) VALUES (?, ?, ?, ?)",
+                (file_hash, file, source, owner_id),
+            )
+            doc_id = cur.lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO document_chunks (document_id, chunk_id) VALUES (?, ?)",
+                [(doc_id, int(c)) for c in chunk_ids],
+            )
+        return doc_id
+
+    def cache_embeddings(self, vectors_by_hash):
+        conn = self.conn
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (chunk_hash, vector) VALUES (?, ?)",
+                [(h, np.asarray(v, dtype="float32").tobytes()) for h, v in vectors_by_hash.items()],
+            )
+
+    def remove(self, ids):
+        """Hard-delete chunks (and their document links) by id."""
+        conn = self.conn
+        with conn:
+            for batch in _batches(int(i) for i in ids):
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+                conn.execute(f"DELETE FROM document_chunks WHERE chunk_id IN ({placeholders})", batch)
+
+    def delete_documents(self, owner_id=None, source=None, file=None):
+        """Delete every document matching the filters and tombstone the chunks
+        no remaining document uses. Returns (documents deleted, tombstoned ids).
+
+        Tombstoned rows stay until purge_deleted() so ids are never reused
+        while their vectors may still be in an index.
+        """
+        conds, args = [], []
+        for column, value in (("owner_id", owner_id), ("source", source), ("file", file)):
+            if value is not None:
+                conds.append(f"{column} = ?")
+                args.append(value)
+        if not conds:
+            raise ValueError("at least one filter is required")
+        where = " AND ".join(conds)
+        conn = self.conn
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            doc_ids = [r[0] for r in conn.execute(f"SELECT id FROM documents WHERE {where}", args)]
+            candidates = set()
+            for batch in _batches(doc_ids):
+                placeholders = ",".join("?" * len(batch))
+                candidates.update(r[0] for r in conn.execute(
+                    f"SELECT chunk_id FROM document_chunks WHERE document_id IN ({placeholders})", batch
+                ))
+                conn.execute(f"DELETE FROM document_chunks WHERE document_id IN ({placeholders})", batch)
+                conn.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", batch)
+            if owner_id is None:
+                # chunks imported from meta.json have no document row
+                candidates.update(r[0] for r in conn.execute(
+                    f"SELECT id FROM chunks WHERE {where} AND {LIVE}"
+                    " AND id NOT IN (SELECT chunk_id FROM document_chunks)",
+                    args,
+                ))
+            orphaned = []
+            for batch in _batches(sorted(candidates)):
+                placeholders = ",".join("?" * len(batch))
+                orphaned.extend(r[0] for r in conn.execute(
+                    f"SELECT id FROM chunks WHERE id IN ({placeholders}) AND {LIVE}"
+                    " AND id NOT IN (SELECT chunk_id FROM document_chunks)",
+                    batch,
+                ))
+            for batch in _batches(orphaned):
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(
+                    f"UPDATE chunks SET deleted_at = CURRENT_TIMESTAMP WHERE id IN ({placeholders})", batch
+                )
+        return len(doc_ids), orphaned
+
+    def purge_deleted(self):
+        """Hard-delete tombstoned chunks and embeddings no live chunk uses.
+        Returns the number of chunks purged."""
+        conn = self.conn
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # remember the high-water mark before the highest ids can disappear
+            (top,) = conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+            if top is not None:
+                conn.execute(
+                    "INSERT INTO counters (name, value) VALUES ('chunk_id', ?)"
+                    " ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (top,),
+                )
+            purged = conn.execute("DELETE FROM chunks WHERE deleted_at IS NOT NULL").rowcount
+            conn.execute(
+                "DELETE FROM embeddings WHERE chunk_hash NOT IN"
+                " (SELECT chunk_hash FROM chunks WHERE chunk_hash IS NOT NULL)"
+            )
+        return purged
+
+    def vacuum(self):
+        """Give the space freed by purge_deleted() back to the filesystem."""
+        conn = self.conn
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def disk_bytes(self):
+        return sum(
+            os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p)
+        )
+
+    def import_meta_json(self, path):
+        """One-shot migration of a legacy meta.json; renames it to *.migrated afterwards."""
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        rows = [
+            (int(_id), item["text"], item.get("source"), item.get("file"), text_sha256(item["text"]))
+            for _id, item in meta.get("items", {}).items()
+        ]
+        conn = self.conn
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunks (id, text, source, file, chunk_hash) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        os.replace(path, path + ".migrated")
+        return len(rows)
+
+    # --- reads ---
+    def lookup(self, ids):
+        """Return items for the given FAISS ids, in order, skipping unknown ids."""
+        wanted = [int(i) for i in ids if int(i) >= 0]
+        by_id = {}
+        for batch in _batches(wanted):
+            placeholders = ",".join("?" * len(batch))
+            for row in self.conn.execute(
+                f"SELECT {ITEM_COLUMNS} FROM chunks WHERE id IN ({placeholders}) AND {LIVE}", batch
+            ):
+                by_id[row[0]] = _row_to_item(row)
+        return [by_id[i] for i in wanted if i in by_id]
+
+    def first(self):
+        row = self.conn.execute(
+            f"SELECT {ITEM_COLUMNS} FROM chunks WHERE {INDEXED} ORDER BY id LIMIT 1"
+        ).fetchone()
+        return _row_to_item(row) if row else None
+
+    def count(self):
+        return self.conn.execute(f"SELECT COUNT(*) FROM chunks WHERE {LIVE}").fetchone()[0]
+
+    def tombstone_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM chunks WHERE deleted_at IS NOT NULL").fetchone()[0]
+
+    def live_ids(self):
+        return np.fromiter(
+            (r[0] for r in self.conn.execute(f"SELECT id FROM chunks WHERE {LIVE} ORDER BY id")), dtype="int64"
+        )
+
+    def find_document(self, file_hash):
+        """Earliest upload with this content hash, with its chunk ids, or None."""
+        row = self.conn.execute(
+            "SELECT id, file, source FROM documents WHERE file_hash = ? ORDER BY id LIMIT 1",
+            (file_hash,),
+        ).fetchone()
+        if row is None:
+            return None
+        chunk_ids = [
+            r[0] for r in self.conn.execute(
+                "SELECT chunk_id FROM document_chunks WHERE document_id = ? ORDER BY chunk_id", (row[0],)
+            )
+        ]
+        return {"id": row[0], "file": row[1], "source": row[2], "chunk_ids": chunk_ids}
+
+    def ids_for_hashes(self, hashes):
+        """Map chunk hashes to the id of an indexed chunk with that content
+        (pending chunks may still be rolled back, so they are never reused)."""
+        found = {}
+        for batch in _batches(set(hashes)):
+            placeholders = ",".join("?" * len(batch))
+            for h, _id in self.conn.execute(
+                f"SELECT chunk_hash, MIN(id) FROM chunks WHERE chunk_hash IN ({placeholders}) AND {INDEXED}"
+                " GROUP BY chunk_hash",
+                batch,
+            ):
+                found[h] = _id
+        return found
+
+    def scope_ids(self, owner_id=None, source=None, file=None):
+        """Sorted ids of the chunks belonging to documents that match every
+        given filter. Chunks shared by several documents are in each one's scope."""
+        conds, args = [], []
+        for column, value in (("owner_id", owner_id), ("source", source), ("file", file)):
+            if value is not None:
+                conds.append(f"d.{column} = ?")
+                args.append(value)
+        where = " AND ".join(conds) or "1"
+        sql = (
+            "SELECT dc.chunk_id FROM document_chunks dc"
+            f" JOIN documents d ON d.id = dc.document_id WHERE {where}"
+        )
+        if owner_id is None:
+            # chunks imported from meta.json have no document row (other chunks
+            # keep the first uploader's source/file, so they must not match here)
+            sql += (f" UNION SELECT id FROM chunks d WHERE {where} AND {INDEXED}"
+                    " AND id NOT IN (SELECT chunk_id FROM document_chunks)")
+            args = args + args
+        ids = np.fromiter((r[0] for r in self.conn.execute(sql, args)), dtype="int64")
+        return np.unique(ids)
+
+    def vectors_for_ids(self, ids):
+        """(ids, vectors) for the given chunk ids whose embedding is cached."""
+        out_ids, vectors = [], []
+        for batch in _batches(int(i) for i in ids):
+            placeholders = ",".join("?" * len(batch))
+            for _id, blob in self.conn.execute(
+                "SELECT c.id, e.vector FROM chunks c JOIN embeddings e ON e.chunk_hash = c.chunk_hash"
+                f" WHERE c.id IN ({placeholders}) AND c.{LIVE}",
+                batch,
+            ):
+                out_ids.append(_id)
+                vectors.append(np.frombuffer(blob, dtype="float32"))
+        if not vectors:
+            return np.empty(0, dtype="int64"), None
+        return np.array(out_ids, dtype="int64"), np.vstack(vectors)
+
+    def cached_embeddings(self, hashes):
+        found = {}
+        for batch in _batches(set(hashes)):
+            placeholders = ",".join("?" * len(batch))
+            for h, blob in self.conn.execute(
+                f"SELECT chunk_hash, vector FROM embeddings WHERE chunk_hash IN ({placeholders})", batch
+            ):
+                found[h] = np.frombuffer(blob, dtype="float32")
+        return found
@@ -0,0 +1,81 @@
+# ragapp/chunking.py
+# Streaming, sentence-aware chunker. Consumes (page_number, text) pairs lazily
+# and only ever holds the current chunk window in memory.
+import re
+from collections import deque, namedtuple
+
+Chunk = namedtuple("Chunk", ["text", "page_start", "page_end"])
+
+# split after . ! ? (optionally followed by a closing quote/bracket) + whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+_TERMINAL = re.compile(r"[.!?][\"')\]]*$")
+
+
+def iter_sentences(pages):
+    """Yield (first_page, last_page, sentence). A sentence cut by a page break
+    is joined with its continuation on the following page(s)."""
+    carry, carry_page = "", None
+    for page_number, text in pages:
+        text = " ".join((text or "").split())
+        if not text:
+            continue
+        if carry:
+            text = carry + " " + text
+        parts = _SENTENCE_END.split(text)
+        # everything but the last piece is a complete sentence
+        for i, sentence in enumerate(parts[:-1]):
+            yield (carry_page if i == 0 and carry else page_number), page_number, sentence
+        first = carry_page if len(parts) == 1 and carry else page_number
+        last = parts[-1]
+        if _TERMINAL.search(last):
+            yield first, page_number, last
+            carry, carry_page = "", None
+        else:
+            carry, carry_page = last, first
+    if carry:
+        yield carry_page, page_number, carry
+
+
+def _split_long(first, last, words, max_tokens):
+    for i in range(0, len(words), max_tokens):
+        piece = words[i:i + max_tokens]
+        yield first, last, " ".join(piece), len(piece)
+
+
+def iter_chunks(pages, max_tokens=500, overlap_tokens=80):
+    """Yield Chunk(text, page_start, page_end) of at most `max_tokens`
+    whitespace tokens, breaking only between sentences (sentences longer than
+    the budget are split on words). Consecutive chunks share up to
+    `overlap_tokens` tokens of trailing whole sentences."""
+    window = deque()  # (first_page, last_page, sentence, n_tokens)
+    size = 0
+    fresh = False  # window holds sentences not yet emitted
+
+    def emit():
+        return Chunk(" ".join(w[2] for w in window), window[0][0], max(w[1] for w in window))
+
+    for first, last, sentence in iter_sentences(pages):
+        words = sentence.split()
+        if len(words) <= max_tokens:
+            pieces = [(first, last, sentence, len(words))]
+        else:
+            pieces = _split_long(first, last, words, max_tokens)
+        for piece in pieces:
+            if size + piece[3] > max_tokens and fresh:
+                yield emit()
+                fresh = False
+                # keep whole trailing sentences that fit the overlap budget
+                kept, kept_size = deque(), 0
+                while window and kept_size + window[-1][3] <= overlap_tokens:
+                    item = window.pop()
+                    kept.appendleft(item)
+                    kept_size += item[3]
+                window, size = kept, kept_size
+            # drop overlap that would not leave room for the new sentence
+            while window and size + piece[3] > max_tokens:
+                size -= window.popleft()[3]
+            window.append(piece)
+            size += piece[3]
+            fresh = True
+    if window and fresh:
+        yield emit()
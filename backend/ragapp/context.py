@@ -0,0 +1,129 @@
+# ragapp/context.py
+# Turns ranked chunks into a compact prompt context: MMR for diversity,
+# near-duplicate removal, merging of overlapping neighbours and a token budget.
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from .hashing import text_sha256
+
+CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+# candidates retrieved per requested chunk, for MMR to choose from
+MMR_FETCH_FACTOR = int(os.getenv("RAG_MMR_FETCH_FACTOR", "3"))
+DUPLICATE_SIMILARITY = float(os.getenv("RAG_DUPLICATE_SIMILARITY", "0.95"))
+# neighbouring chunks share at most this many tokens (chunk overlap is 80)
+MAX_OVERLAP_TOKENS = 200
+# don't bother adding a truncated passage shorter than this
+MIN_PASSAGE_TOKENS = 50
+SEPARATOR = "\n\n---\n\n"
+
+Context = namedtuple("Context", ["text", "passages", "tokens", "naive_tokens"])
+
+
+def count_tokens(text):
+    # same whitespace tokens the chunker budgets with
+    return len(text.split())
+
+
+def mmr(query, vectors, k, lam=MMR_LAMBDA, duplicate=DUPLICATE_SIMILARITY):
+    """Row indices of up to k vectors picked by maximal marginal relevance.
+    Rows at least `duplicate` similar to an already picked row are dropped."""
+    relevance = vectors @ query
+    redundancy = np.zeros(len(vectors), dtype="float32")
+    open_rows = np.ones(len(vectors), dtype=bool)
+    picked = []
+    while len(picked) < k and open_rows.any():
+        scores = np.where(open_rows, lam * relevance - (1 - lam) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        similarity = vectors @ vectors[best]
+        redundancy = np.maximum(redundancy, similarity)
+        open_rows &= similarity < duplicate
+        open_rows[best] = False
+    return picked
+
+
+def _overlap(left, right):
+    """Number of tokens at the end of `left` repeated at the start of `right`."""
+    for n in range(min(len(left), len(right), MAX_OVERLAP_TOKENS), 0, -1):
+        if left[-n:] == right[:n]:
+            return n
+    return 0
+
+
+def _adjacent(passage, item):
+    """Whether `item` may continue `passage` in its file: same file and, when
+    both record pages, starting on the passage's last page or the next one.
+    Ids say nothing here, since deduplicated chunks are shared across files."""
+    if passage["file"] != item.get("file"):
+        return False
+    if passage["page_end"] is None or item.get("page_start") is None:
+        return True
+    return passage["page_end"] <= item["page_start"] <= passage["page_end"] + 1
+
+
+def merge_neighbours(items):
+    """Merge chunks that continue each other in the same file (adjacent pages
+    and overlapping text) into one passage, dropping the tokens they overlap
+    on. Passages keep the best rank of their members (items are given in
+    rank order)."""
+    ranked = [dict(item, rank=rank) for rank, item in enumerate(items)]
+    ranked.sort(key=lambda i: (i.get("file") or "", i.get("page_start") or 0, i["id"]))
+    passages = []
+    for item in ranked:
+        prev = passages[-1] if passages else None
+        right = item["text"].split()
+        overlap = _overlap(prev["tokens"], right) if prev and _adjacent(prev, item) else 0
+        if overlap:
+            prev["tokens"] += right[overlap:]
+            prev["ids"].append(item["id"])
+            prev["rank"] = min(prev["rank"], item["rank"])
+            if item.get("page_end") is not None:
+                prev["page_end"] = item["page_end"]
+            continue
+        passages.append({
+            "id": item["id"], "ids": [item["id"]], "tokens": right,
+            "file": item.get("file"), "source": item.get("source"),
+            "page_start": item.get("page_start"), "page_end": item.get("page_end"),
+            "rank": item["rank"],
+        })
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def pack(items, query_vec, vectors_by_id, k, budget=CONTEXT_TOKENS):
+    """Build the prompt context for ranked `items` (most relevant first).
+
+    Picks k diverse items by MMR when every item has a vector in
+    `vectors_by_id` (otherwise keeps rank order and drops exact duplicates),
+    merges overlapping neighbours and fills at most `budget` tokens.
+    `naive_tokens` is what joining the chosen chunks verbatim would cost, so
+    it is never below `tokens`.
+    """
+    if items and all(i["id"] in vectors_by_id for i in items):
+        vectors = np.vstack([vectors_by_id[i["id"]] for i in items])
+        chosen = [items[j] for j in sorted(mmr(query_vec, vectors, k))]
+    else:
+        seen, chosen = set(), []
+        for item in items:
+            h = text_sha256(item["text"])
+            if h not in seen:
+                seen.add(h)
+                chosen.append(item)
+        chosen = chosen[:k]
+    naive_tokens = sum(count_tokens(i["text"]) for i in chosen)
+
+    parts, passages, used = [], [], 0
+    for passage in merge_neighbours(chosen):
+        tokens = passage.pop("tokens")
+        room = budget - used
+        if len(tokens) > room:
+            if room < MIN_PASSAGE_TOKENS:
+                break
+            tokens = tokens[:room]
+        parts.append(" ".join(tokens))
+        passages.append(passage)
+        used += len(tokens)
+    return Context(SEPARATOR.join(parts), passages, used, naive_tokens)
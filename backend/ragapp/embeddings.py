@@ -0,0 +1,108 @@
+# ragapp/embeddings.py
+# Shared embedding helpers. Kept free of Django imports so standalone scripts
+# (ingest.py, main.py) can use the same batched pipeline.
+import os
+import atexit
+import threading
+
+import numpy as np
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# known up front so indexes can be created without loading the model
+EMB_DIM = 384
+
+# "torch" (default), "torch-int8" (dynamically quantized Linear layers),
+# "onnx" or "onnx-int8" (ONNX Runtime; needs `pip install optimum[onnxruntime]`)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# quantized ONNX export shipped in the model repo; pick the one matching the CPU
+EMBED_ONNX_INT8_FILE = os.getenv("EMBED_ONNX_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+
+# chunks per encode() call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# documents with at least this many chunks go through the multi-process pool (0 = never)
+EMBED_POOL_MIN_CHUNKS = int(os.getenv("EMBED_POOL_MIN_CHUNKS", "0"))
+# comma separated target devices for the pool, e.g. "cpu,cpu,cpu,cpu"
+EMBED_POOL_DEVICES = os.getenv("EMBED_POOL_DEVICES", "")
+
+_embedder = None
+_embedder_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _load(backend):
+    # imported here: sentence_transformers pulls in torch, which alone takes
+    # seconds, and most processes (migrate, auth-only workers) never embed
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(MODEL_NAME)
+    if backend == "torch-int8":
+        import torch
+
+        model = SentenceTransformer(MODEL_NAME, device="cpu")
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        return SentenceTransformer(MODEL_NAME, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(MODEL_NAME, backend="onnx", model_kwargs={"file_name": EMBED_ONNX_INT8_FILE})
+    raise ValueError(f"unknown EMBED_BACKEND: {backend}")
+
+
+def get_embedder():
+    """The shared model, loaded on first use."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                model = _load(EMBED_BACKEND)
+                dim = model.get_sentence_embedding_dimension()
+                if dim != EMB_DIM:
+                    raise RuntimeError(f"{MODEL_NAME} produces {dim}-d vectors, expected {EMB_DIM}")
+                _embedder = model
+    return _embedder
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            embedder = get_embedder()
+            devices = [d.strip() for d in EMBED_POOL_DEVICES.split(",") if d.strip()] or None
+            _pool = embedder.start_multi_process_pool(target_devices=devices)
+            atexit.register(embedder.stop_multi_process_pool, _pool)
+        return _pool
+
+
+def create_embedding(text):
+    """Embed a single string (e.g. a chat question)."""
+    vec = get_embedder().encode([text], normalize_embeddings=True)[0]
+    return np.array(vec, dtype="float32")
+
+
+def should_use_pool(n):
+    return bool(EMBED_POOL_MIN_CHUNKS) and n >= EMBED_POOL_MIN_CHUNKS
+
+
+def embed_texts(texts, batch_size=None, use_pool=None):
+    """Embed many strings at once.
+
+    Returns a float32 (n, EMB_DIM) array, L2-normalized exactly once by the
+    model. Large inputs are spread over a multi-process pool when
+    EMBED_POOL_MIN_CHUNKS is set (or use_pool=True).
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, EMB_DIM), dtype="float32")
+
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    if use_pool is None:
+        use_pool = should_use_pool(len(texts))
+
+    if use_pool:
+        vecs = get_embedder().encode_multi_process(
+            texts, _get_pool(), batch_size=batch_size, normalize_embeddings=True
+        )
+    else:
+        vecs = get_embedder().encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    return np.ascontiguousarray(vecs, dtype="float32")
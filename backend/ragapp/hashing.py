@@ -0,0 +1,15 @@
+# ragapp/hashing.py
+import hashlib
+
+
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_sha256(text):
+    # whitespace-insensitive so re-extracted text with different line breaks still matches
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
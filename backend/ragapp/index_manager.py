@@ -0,0 +1,206 @@
+# ragapp/index_manager.py
+import os
+import threading
+from contextlib import contextmanager
+
+import faiss
+
+from . import ann
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class RWLock:
+    """Reader/writer lock: many concurrent readers, one exclusive writer.
+
+    Writers are preferred so an upload is not starved by steady chat traffic.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on `path` shared by every process on this machine."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10 s
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class IndexManager:
+    """Process-resident FAISS index.
+
+    The index is read from disk once and then served from memory. Every access
+    stats the index file (cheap) and reloads only when another worker has
+    written a newer version, so multiple gunicorn/uvicorn workers stay in sync.
+    """
+
+    def __init__(self, index_path, dim):
+        self.index_path = index_path
+        self.dim = dim
+        self._lock = RWLock()
+        self._index = None
+        self._stamp = None
+        # bumped whenever the in-memory index changes (reload or local write)
+        self.generation = 0
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "reloads": 0, "saves": 0}
+
+    # --- disk state ---
+    def _disk_stamp(self):
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        stamp = self._disk_stamp()
+        if stamp is not None:
+            index = faiss.read_index(self.index_path)
+        else:
+            index = ann.new_flat_index(self.dim)
+        self._index, self._stamp = index, stamp
+        self.generation += 1
+        self._count("reloads")
+
+    def _save(self):
+        _atomic_write(self.index_path, lambda p: faiss.write_index(self._index, p))
+        self._stamp = self._disk_stamp()
+        self.generation += 1
+        self._count("saves")
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _is_stale(self):
+        return self._index is None or self._disk_stamp() != self._stamp
+
+    def _refresh(self):
+        if not self._is_stale():
+            self._count("hits")
+            return
+        with self._lock.write():
+            # another thread may have reloaded while we waited for the lock
+            if self._is_stale():
+                self._load()
+            else:
+                self._count("hits")
+
+    # --- public API ---
+    def refresh(self):
+        """Reload if another worker changed the index; return the current generation."""
+        self._refresh()
+        return self.generation
+
+    @contextmanager
+    def reading(self):
+        """Yield the index for read-only use under a shared lock."""
+        while True:
+            self._refresh()
+            with self._lock.read():
+                # a failed write may have dropped the index after _refresh()
+                if self._index is not None:
+                    yield self._index
+                    return
+
+    @contextmanager
+    def writing(self, promote=True):
+        """Yield the index for mutation under an exclusive lock; saves on exit.
+
+        The lock also covers other processes (a lock file next to the index),
+        so two workers never mutate their own stale copies and overwrite
+        each other's save.
+        """
+        with self._lock.write(), _file_lock(self.index_path + ".lock"):
+            if self._is_stale():
+                self._load()
+            try:
+                yield self._index
+            except BaseException:
+                # drop the half-applied mutation; next access reloads from disk
+                self._index = None
+                raise
+            # flat -> IVF/HNSW once the corpus passes the promotion threshold
+            if promote:
+                self._index = ann.maybe_promote(self._index)
+            self._save()
+
+    def replace(self, index):
+        """Swap in a rebuilt index; only valid inside writing()."""
+        self._index = index
+
+    def search(self, vectors, k, nprobe=None, ef_search=None, ids=None):
+        """Top-k search; nprobe/ef_search tune IVF/HNSW indexes for this query only,
+        `ids` limits results to those chunk ids."""
+        with self.reading() as index:
+            params = ann.search_params(index, nprobe=nprobe, ef_search=ef_search, ids=ids)
+            return index.search(vectors, k, params=params)
+
+    def stats(self):
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["generation"] = self.generation
+        index = self._index
+        out["vectors"] = index.ntotal if index is not None else 0
+        out["index_type"] = ann.index_kind(index) if index is not None else None
+        return out
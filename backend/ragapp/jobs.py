@@ -0,0 +1,105 @@
+# ragapp/jobs.py
+# Background job queue backed by the IngestJob table; no external broker.
+import os
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import IngestJob
+
+logger = logging.getLogger(__name__)
+
+# kind -> dotted path of handler(job, progress) returning a JSON-able result
+JOB_HANDLERS = {
+    "index_pdf": "ragapp.views.index_pdf_job",
+    "compact_index": "ragapp.views.compact_index_job",
+    "extract_curriculum": "studyapp.views.extract_curriculum_job",
+}
+
+# in-process worker threads per web process (0 = only `manage.py run_ingest_workers`)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "2.0"))
+# running jobs older than this are assumed orphaned by a dead process and re-queued
+INGEST_STALE_AFTER = int(os.getenv("INGEST_STALE_AFTER", "1800"))
+
+_wakeup = threading.Event()
+_start_lock = threading.Lock()
+_threads = []
+
+
+def enqueue(kind, **payload):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"unknown job kind: {kind}")
+    job = IngestJob.objects.create(kind=kind, payload=payload)
+    start_workers()
+    _wakeup.set()
+    return job
+
+
+def start_workers(count=None):
+    """Start the in-process worker threads once per process."""
+    count = INGEST_WORKERS if count is None else count
+    with _start_lock:
+        if _threads or count <= 0:
+            return
+        requeue_stale()
+        for i in range(count):
+            t = threading.Thread(target=worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            _threads.append(t)
+
+
+def requeue_stale():
+    cutoff = timezone.now() - timedelta(seconds=INGEST_STALE_AFTER)
+    return IngestJob.objects.filter(status=IngestJob.RUNNING, started_at__lt=cutoff).update(
+        status=IngestJob.QUEUED, stage="requeued"
+    )
+
+
+def claim_next():
+    """Atomically move the oldest queued job to running; safe across processes."""
+    candidates = IngestJob.objects.filter(status=IngestJob.QUEUED).order_by("id")
+    for job_id in candidates.values_list("id", flat=True)[:10]:
+        claimed = IngestJob.objects.filter(id=job_id, status=IngestJob.QUEUED).update(
+            status=IngestJob.RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return IngestJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    def progress(stage, done=0, total=0):
+        IngestJob.objects.filter(id=job.id).update(stage=stage, progress=done, total=total)
+
+    try:
+        handler = import_string(JOB_HANDLERS[job.kind])
+        result = handler(job, progress)
+        IngestJob.objects.filter(id=job.id).update(
+            status=IngestJob.DONE, stage="done", result=result, finished_at=timezone.now()
+        )
+    except Exception as e:
+        logger.error("job %s failed:\n%s", job.id, traceback.format_exc())
+        IngestJob.objects.filter(id=job.id).update(
+            status=IngestJob.FAILED, error=str(e), finished_at=timezone.now()
+        )
+
+
+def worker_loop(stop_event=None):
+    while stop_event is None or not stop_event.is_set():
+        try:
+            job = claim_next()
+            if job is not None:
+                run_job(job)
+                continue
+        except Exception:
+            logger.exception("ingest worker error")
+        finally:
+            close_old_connections()
+        _wakeup.wait(INGEST_POLL_INTERVAL)
+        _wakeup.clear()
@@ -0,0 +1,116 @@
+# ragapp/llm_cache.py
+# Two-tier cache for LLM responses: in-process LRU in front of a SQLite table
+# shared by every worker process.
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from .query_cache import TTLCache
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# calls above this temperature are sampled for variety and not cached by default:
+# chat and study plans (<= 0.3) are cached, flashcard/worksheet/question
+# generation (0.4-0.6) draws new items on every call
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS llm_responses ("
+    " key TEXT PRIMARY KEY,"
+    " response TEXT NOT NULL,"
+    " latency REAL NOT NULL,"  # seconds the original call took
+    " created_at REAL NOT NULL)"
+)
+
+
+def cache_key(model, prompt, config):
+    payload = json.dumps({"model": model, "prompt": prompt, "config": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Responses keyed on (model, prompt, generation config).
+
+    Lookups try the in-memory LRU, then SQLite; both expire entries after
+    `ttl` seconds. Each entry remembers how long the real call took, so
+    stats() can report the latency saved by hits.
+    """
+
+    def __init__(self, path, maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize, ttl)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "saved_seconds": 0.0}
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(SCHEMA)
+        return conn
+
+    def _count(self, key, saved=0.0):
+        with self._stats_lock:
+            self._stats[key] += 1
+            self._stats["saved_seconds"] += saved
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            self._count("memory_hits", entry[1])
+            return entry[0]
+        row = self.conn.execute(
+            "SELECT response, latency FROM llm_responses WHERE key = ? AND created_at > ?",
+            (key, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self.memory.set(key, (row[0], row[1]))
+        self._count("disk_hits", row[1])
+        return row[0]
+
+    def set(self, key, response, latency):
+        self.memory.set(key, (response, latency))
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, latency, created_at) VALUES (?, ?, ?, ?)",
+                (key, response, latency, time.time()),
+            )
+        self._count("stores")
+
+    def purge_expired(self):
+        with self.conn:
+            return self.conn.execute(
+                "DELETE FROM llm_responses WHERE created_at <= ?", (time.time() - self.ttl,)
+            ).rowcount
+
+    def stats(self):
+        with self._stats_lock:
+            out = dict(self._stats)
+        hits = out["memory_hits"] + out["disk_hits"]
+        total = hits + out["misses"]
+        out["hit_rate"] = round(hits / total, 3) if total else 0.0
+        out["saved_seconds"] = round(out["saved_seconds"], 3)
+        out["memory_size"] = self.memory.stats()["size"]
+        return out
+
+
+def should_cache(temperature, cache=None):
+    """Per-call switch: an explicit True/False wins, otherwise cache unless the
+    call samples at a high temperature."""
+    if not LLM_CACHE_ENABLED:
+        return False
+    if cache is not None:
+        return bool(cache)
+    return temperature <= LLM_CACHE_MAX_TEMPERATURE
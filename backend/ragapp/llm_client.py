@@ -0,0 +1,160 @@
+# ragapp/llm_client.py
+# Shared Gemini access for ragapp and studyapp: reused model handles, a bound
+# on concurrent calls, a tokens-per-minute budget and retries with jittered
+# backoff when the provider rate-limits us.
+import os
+import time
+import random
+import itertools
+import threading
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+# prompt + max output tokens admitted per minute (0 = no budget)
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30"))
+# e.g. http://127.0.0.1:8765 to use `manage.py gemini_stub` instead of Google
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")
+
+RETRYABLE = (
+    api_exceptions.ResourceExhausted,  # 429
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,  # 503
+    api_exceptions.DeadlineExceeded,
+)
+
+
+class RateLimited(Exception):
+    """The provider kept rejecting the call after every retry."""
+
+
+def configure(api_key=None):
+    kwargs = {"api_key": api_key or os.getenv("GEMINI_API_KEY")}
+    if GEMINI_BASE_URL:
+        kwargs["api_key"] = kwargs["api_key"] or "stub"
+        kwargs["transport"] = "rest"
+        kwargs["client_options"] = {"api_endpoint": GEMINI_BASE_URL}
+    genai.configure(**kwargs)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Refills `per_minute` tokens evenly over a minute; acquire() blocks
+    until the requested amount is available."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n):
+        if not self.capacity:
+            return 0.0
+        n = min(n, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return waited
+                delay = (n - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class GeminiClient:
+    def __init__(self, max_concurrency=GEMINI_MAX_CONCURRENCY, tpm=GEMINI_TPM,
+                 max_retries=GEMINI_MAX_RETRIES, backoff_base=GEMINI_BACKOFF_BASE,
+                 backoff_max=GEMINI_BACKOFF_MAX):
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.budget = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._models = {}
+        self._models_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "rate_limited": 0, "budget_wait_seconds": 0.0}
+
+    def model(self, name):
+        handle = self._models.get(name)
+        if handle is None:
+            with self._models_lock:
+                handle = self._models.setdefault(name, genai.GenerativeModel(name))
+        return handle
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _backoff(self, attempt):
+        # "full jitter": spreads retries from concurrent callers apart
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _admit(self, prompt, config):
+        cost = estimate_tokens(prompt) + int(config.get("max_output_tokens", 0))
+        self._count("budget_wait_seconds", self.budget.acquire(cost))
+
+    def generate(self, prompt, model, config):
+        """Return the response text for one prompt."""
+        self._admit(prompt, config)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    self._count("calls")
+                    return self.model(model).generate_content(prompt, generation_config=config).text
+            except RETRYABLE as e:
+                if attempt == self.max_retries:
+                    self._count("rate_limited")
+                    raise RateLimited(str(e)) from e
+                self._count("retries")
+                time.sleep(self._backoff(attempt))
+
+    def stream(self, prompt, model, config):
+        """Yield text pieces as they arrive. Only the request itself is retried;
+        once text has been yielded an error is raised to the caller.
+
+        A slot is held until the first piece arrives, not for the whole
+        response, so slow readers can't starve the other calls of slots."""
+        self._admit(prompt, config)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    self._count("calls")
+                    response = iter(self.model(model).generate_content(prompt, generation_config=config, stream=True))
+                    first = next(response, None)
+                break
+            except RETRYABLE as e:
+                if attempt == self.max_retries:
+                    self._count("rate_limited")
+                    raise RateLimited(str(e)) from e
+                self._count("retries")
+            time.sleep(self._backoff(attempt))
+        if first is None:
+            return
+        for chunk in itertools.chain([first], response):
+            if chunk.parts:
+                yield chunk.text
+
+    def stats(self):
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["budget_wait_seconds"] = round(out["budget_wait_seconds"], 3)
+        return out
+
+
+configure()
+client = GeminiClient()
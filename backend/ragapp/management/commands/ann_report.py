@@ -0,0 +1,63 @@
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ragapp import ann
+from ragapp.views import index_manager
+
+
+class Command(BaseCommand):
+    help = "Recall@k and latency of IVF-Flat / HNSW against exact (flat) search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--synthetic", type=int, default=0,
+                            help="use N random unit vectors instead of the stored corpus")
+        parser.add_argument("--nprobe", default="1,4,8,16,32,64")
+        parser.add_argument("--ef-search", default="16,32,64,128,256")
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        if options["synthetic"]:
+            rng = np.random.default_rng(0)
+            vectors = rng.standard_normal((options["synthetic"], index_manager.dim)).astype("float32")
+            faiss.normalize_L2(vectors)
+            ids = np.arange(len(vectors), dtype="int64")
+        else:
+            with index_manager.reading() as index:
+                ids, vectors = ann.all_vectors(faiss.clone_index(index))
+        if len(vectors) <= k:
+            raise CommandError(f"need more than {k} vectors, have {len(vectors)}")
+
+        # perturbed corpus vectors stand in for real questions
+        rng = np.random.default_rng(1)
+        picks = rng.choice(len(vectors), size=min(options["queries"], len(vectors)), replace=False)
+        queries = vectors[picks] + 0.05 * rng.standard_normal((len(picks), vectors.shape[1])).astype("float32")
+        faiss.normalize_L2(queries)
+
+        def timed(index, params=None):
+            start = time.perf_counter()
+            _, I = index.search(queries, k, params=params)
+            return I, (time.perf_counter() - start) * 1000 / len(queries)
+
+        flat = ann.build_index("flat", vectors.shape[1], vectors, ids)
+        truth, flat_ms = timed(flat)
+        self.stdout.write(f"{len(vectors)} vectors, {len(queries)} queries, k={k}")
+        self.stdout.write(f"{'index':<8}{'param':<16}{'recall@k':>10}{'ms/query':>10}")
+        self.stdout.write(f"{'flat':<8}{'-':<16}{1.0:>10.3f}{flat_ms:>10.3f}")
+
+        def recall(I):
+            return np.mean([len(set(a) & set(b)) / k for a, b in zip(I, truth)])
+
+        ivf = ann.build_index("ivf", vectors.shape[1], vectors, ids)
+        for nprobe in [int(x) for x in options["nprobe"].split(",")]:
+            I, ms = timed(ivf, faiss.SearchParametersIVF(nprobe=nprobe))
+            self.stdout.write(f"{'ivf':<8}{f'nprobe={nprobe}':<16}{recall(I):>10.3f}{ms:>10.3f}")
+
+        hnsw = ann.build_index("hnsw", vectors.shape[1], vectors, ids)
+        for ef in [int(x) for x in options["ef_search"].split(",")]:
+            I, ms = timed(hnsw, faiss.SearchParametersHNSW(efSearch=ef))
+            self.stdout.write(f"{'hnsw':<8}{f'efSearch={ef}':<16}{recall(I):>10.3f}{ms:>10.3f}")
@@ -0,0 +1,49 @@
+import os
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ragapp.embeddings import create_embedding, embed_texts
+from ragapp.views import extract_text_from_pdf, chunk_text
+
+
+class Command(BaseCommand):
+    help = "Compare per-chunk vs batched embedding throughput (chunks/sec) on uploaded PDFs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=os.path.join(settings.BASE_DIR, "uploads"))
+        parser.add_argument("--batch-sizes", default="16,32,64,128")
+        parser.add_argument("--pool", action="store_true", help="also time the multi-process pool")
+
+    def handle(self, *args, **options):
+        pdfs = sorted(f for f in os.listdir(options["dir"]) if f.lower().endswith(".pdf"))
+        if not pdfs:
+            raise CommandError(f"no PDFs in {options['dir']}")
+
+        chunks = []
+        for name in pdfs:
+            chunks.extend(chunk_text(extract_text_from_pdf(os.path.join(options["dir"], name))))
+        self.stdout.write(f"{len(pdfs)} PDFs, {len(chunks)} chunks")
+
+        # warm up the model so the first timing doesn't include lazy init
+        embed_texts(chunks[:8])
+
+        def report(label, fn):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{label:<28} {len(chunks) / elapsed:10.1f} chunks/sec")
+
+        def per_chunk():
+            # the old upload_pdf path: encode one chunk at a time, then re-normalize
+            arr = np.vstack([create_embedding(c) for c in chunks]).astype("float32")
+            faiss.normalize_L2(arr)
+
+        report("per-chunk (before)", per_chunk)
+        for bs in [int(b) for b in options["batch_sizes"].split(",")]:
+            report(f"batched bs={bs}", lambda: embed_texts(chunks, batch_size=bs, use_pool=False))
+        if options["pool"]:
+            report("multi-process pool", lambda: embed_texts(chunks, use_pool=True))
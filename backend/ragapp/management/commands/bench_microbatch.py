@@ -0,0 +1,48 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from ragapp.embeddings import embed_texts
+from ragapp.views import index_manager, query_embedder, query_searcher
+
+WORDS = "what is a pointer array loop memory stack heap struct function value address index".split()
+
+
+class Command(BaseCommand):
+    help = "Query throughput with and without micro-batching at several client concurrencies."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", default="1,8,32")
+        parser.add_argument("--requests", type=int, default=512)
+        parser.add_argument("--k", type=int, default=3)
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        rng = random.Random(0)
+        # unique questions so the query caches never help
+        questions = [" ".join(rng.choices(WORDS, k=8)) + f" #{i}" for i in range(options["requests"])]
+
+        def direct(q):
+            vec = embed_texts([q])
+            return index_manager.search(vec, k)[1][0]
+
+        def batched(q):
+            vec = query_embedder.submit(q)
+            return query_searcher.submit((vec, k, None, None))
+
+        index_manager.refresh()
+        direct(questions[0])  # warm up model + index
+        self.stdout.write(f"{index_manager.stats()['vectors']} vectors, {len(questions)} queries")
+        self.stdout.write(f"{'clients':>8}{'direct q/s':>14}{'batched q/s':>14}{'avg batch':>11}")
+        for clients in [int(c) for c in options["clients"].split(",")]:
+            rates = []
+            for fn in (direct, batched):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=clients) as pool:
+                    list(pool.map(fn, questions))
+                rates.append(len(questions) / (time.perf_counter() - start))
+            avg = query_embedder.stats()["avg_batch"]
+            query_embedder.batches = query_embedder.items = 0
+            self.stdout.write(f"{clients:>8}{rates[0]:>14.1f}{rates[1]:>14.1f}{avg:>11.2f}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ragapp import ann
+from ragapp.views import index_manager
+
+
+class Command(BaseCommand):
+    help = "Rebuild the RAG index as flat, IVF-Flat or HNSW right now (ignores the promotion threshold)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["flat", "ivf", "hnsw"])
+        parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(n))")
+
+    def handle(self, *args, **options):
+        with index_manager.writing(promote=False) as index:
+            ids, vectors = ann.all_vectors(index)
+            rebuilt = ann.build_index(options["kind"], index.d, vectors, ids, nlist=options["nlist"])
+            index_manager.replace(rebuilt)
+        self.stdout.write(self.style.SUCCESS(f"rebuilt {len(ids)} vectors as {options['kind']}"))
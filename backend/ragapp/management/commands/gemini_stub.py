@@ -0,0 +1,82 @@
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+def _response(text):
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": len(text) // 4, "totalTokenCount": 0},
+    }
+
+
+def make_handler(latency, fail_rate, reply, counters, lock):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            with lock:
+                counters["requests"] += 1
+            if random.random() < fail_rate:
+                with lock:
+                    counters["rate_limited"] += 1
+                return self._send(429, {"error": {"code": 429, "message": "stub: quota exceeded",
+                                                  "status": "RESOURCE_EXHAUSTED"}})
+            time.sleep(latency)
+            parts = request.get("contents", [{}])[-1].get("parts", [{}])
+            prompt = parts[0].get("text", "") if parts else ""
+            text = reply or f"stub answer ({len(prompt)} prompt chars)"
+            if ":streamGenerateContent" in self.path:
+                # the REST transport reads a JSON array of partial responses
+                words = text.split(" ")
+                pieces = [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+                return self._send(200, [_response(p) for p in pieces])
+            return self._send(200, _response(text))
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = ("Serve a local stand-in for the Gemini REST API. Point the apps at it with "
+            "GEMINI_BASE_URL=http://127.0.0.1:<port>.")
+    # the URL checks would import the views and load the embedding model
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.2, help="seconds per response")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 429")
+        parser.add_argument("--reply", default="", help="fixed response text")
+
+    def handle(self, *args, **options):
+        counters = {"requests": 0, "rate_limited": 0}
+        handler = make_handler(options["latency"], options["fail_rate"], options["reply"],
+                               counters, threading.Lock())
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), handler)
+        self.stdout.write(self.style.SUCCESS(f"Gemini stub on http://127.0.0.1:{options['port']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"requests: {counters['requests']}, rate limited: {counters['rate_limited']}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ragapp.views import chunk_store, META_PATH
+
+
+class Command(BaseCommand):
+    help = "Import legacy faiss_index/meta.json files into the SQLite chunk store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help=f"meta.json files (default: {META_PATH})")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or [META_PATH]
+        for path in paths:
+            try:
+                n = chunk_store.import_meta_json(path)
+            except FileNotFoundError:
+                raise CommandError(f"{path} not found (already migrated?)")
+            self.stdout.write(self.style.SUCCESS(f"{path}: imported {n} chunks"))
@@ -0,0 +1,24 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from ragapp import jobs
+
+
+class Command(BaseCommand):
+    help = "Run background ingestion workers in the foreground (use with INGEST_WORKERS=0 on web processes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+
+    def handle(self, *args, **options):
+        jobs.requeue_stale()
+        threads = [
+            threading.Thread(target=jobs.worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(options["workers"])
+        ]
+        for t in threads:
+            t.start()
+        self.stdout.write(self.style.SUCCESS(f"{len(threads)} ingest workers running"))
+        for t in threads:
+            t.join()
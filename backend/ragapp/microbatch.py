@@ -0,0 +1,95 @@
+# ragapp/microbatch.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+BATCH_MAX = int(os.getenv("RAG_BATCH_MAX", "32"))
+BATCH_WAIT_MS = float(os.getenv("RAG_BATCH_WAIT_MS", "3"))
+
+
+class MicroBatcher:
+    """Turns concurrent single-item calls into batched calls.
+
+    Callers block in submit(); a background thread gathers whatever arrives
+    within `max_wait_ms` of the first item (up to `max_batch` items), calls
+    `fn(items)` once and hands each caller its own result. `fn` must return
+    one result per item, in order; an exception instance in place of a
+    result is raised to that caller only.
+
+    The wait only happens while there is concurrency (the previous batch had
+    more than one item), so a lone caller pays no extra latency.
+    """
+
+    def __init__(self, fn, max_batch=BATCH_MAX, max_wait_ms=BATCH_WAIT_MS, name="microbatch"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._name = name
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        if self.max_batch <= 1:
+            result = self.fn([item])[0]
+            if isinstance(result, BaseException):
+                raise result
+            return result
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _ensure_thread(self):
+        # is_alive() also covers a forked child, where the thread did not survive
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        last_size = 0
+        while True:
+            batch = [self._queue.get()]
+            wait = self.max_wait if last_size > 1 else 0
+            deadline = time.monotonic() + wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            last_size = len(batch)
+
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.fn(items))
+                if len(results) != len(items):
+                    # zip() would leave the extra callers waiting forever
+                    raise RuntimeError(f"{self._name}: got {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
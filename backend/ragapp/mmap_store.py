@@ -0,0 +1,67 @@
+# ragapp/mmap_store.py
+# Read-only, memory-mapped index + chunk text for serving processes.
+# Pages are shared through the OS page cache, so N workers cost ~1 copy.
+import os
+import mmap
+
+import faiss
+import numpy as np
+
+TEXTS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets.npy"
+
+
+def mmap_flags():
+    # IO_FLAG_MMAP_IFC (newer faiss) maps the whole file and reads vector codes
+    # zero-copy; older builds only support IO_FLAG_MMAP, which maps IVF lists.
+    # The two flags cannot be combined.
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+def load_index(path, use_mmap=True):
+    if use_mmap:
+        return faiss.read_index(path, mmap_flags())
+    return faiss.read_index(path)
+
+
+def export_texts(store, out_dir):
+    """Write chunk texts from a ChunkStore as a flat UTF-8 blob plus an
+    (id, offset, length) table sorted by id."""
+    rows = []
+    tmp_texts = os.path.join(out_dir, TEXTS_FILE + ".tmp")
+    offset = 0
+    with open(tmp_texts, "wb") as f:
+        for _id, text in store.conn.execute("SELECT id, text FROM chunks ORDER BY id"):
+            data = text.encode("utf-8")
+            f.write(data)
+            rows.append((_id, offset, len(data)))
+            offset += len(data)
+    table = np.array(rows, dtype="int64").reshape(-1, 3)
+    tmp_offsets = os.path.join(out_dir, "chunks.offsets.tmp.npy")
+    np.save(tmp_offsets, table)
+    os.replace(tmp_texts, os.path.join(out_dir, TEXTS_FILE))
+    os.replace(tmp_offsets, os.path.join(out_dir, OFFSETS_FILE))
+    return len(rows)
+
+
+class MmapTexts:
+    """Chunk text lookup over the files written by export_texts()."""
+
+    def __init__(self, out_dir):
+        self.table = np.load(os.path.join(out_dir, OFFSETS_FILE), mmap_mode="r")
+        self._file = open(os.path.join(out_dir, TEXTS_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def lookup(self, ids):
+        """Same shape as ChunkStore.lookup: items in order, unknown ids skipped."""
+        out = []
+        ids_col = self.table[:, 0]
+        for _id in ids:
+            _id = int(_id)
+            pos = int(np.searchsorted(ids_col, _id))
+            if _id < 0 or pos >= len(ids_col) or ids_col[pos] != _id:
+                continue
+            _, offset, length = (int(v) for v in self.table[pos])
+            out.append({"id": _id, "text": self._blob[offset:offset + length].decode("utf-8")})
+        return out
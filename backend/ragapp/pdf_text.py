@@ -0,0 +1,115 @@
+# ragapp/pdf_text.py
+# PDF text extraction: page-parallel for large files, cached on disk by content hash.
+import os
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+from .hashing import file_sha256
+
+# PDFs with at least this many pages are split across a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+
+def _extract_range(path, start, stop):
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_extract(path):
+    """Yield the text of each page in order (empty string for pages without text).
+
+    Small PDFs are read page by page; large ones are split into page ranges
+    across a process pool, still yielded in page order as ranges complete.
+    """
+    reader = PdfReader(path)
+    n = len(reader.pages)
+    # at least ~20 pages per process, otherwise spawn overhead dominates
+    workers = min(PDF_EXTRACT_WORKERS, n // 20)
+    if n < PDF_PARALLEL_MIN_PAGES or workers <= 1:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    # a few ranges per worker evens out pages that are slower to parse
+    step = max(1, -(-n // (workers * 2)))
+    ranges = [(start, min(start + step, n)) for start in range(0, n, step)]
+    # spawn, not fork: callers are multi-threaded web/ingest workers
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        for part in pool.map(_extract_range, [path] * len(ranges), *zip(*ranges)):
+            yield from part
+
+
+def page_count(path):
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path):
+    return list(iter_extract(path))
+
+
+class TextCache:
+    """Extracted page text on disk, keyed by the PDF's SHA-256.
+
+    Identical files uploaded under different names (or to different apps)
+    are parsed once. Pages are stored one JSON string per line so they can
+    be streamed without loading the whole book.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._hashes = {}  # (path, mtime, size) -> sha256, avoids re-hashing
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def file_hash(self, path):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._hashes.get(key)
+        if cached is None:
+            cached = file_sha256(path)
+            with self._lock:
+                self._hashes[key] = cached
+        return cached
+
+    def _path_for(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest + ".jsonl")
+
+    def iter_pages(self, path):
+        """Yield (page_number, text) pairs, 1-based, from the cache or the PDF."""
+        cache_path = self._path_for(self.file_hash(path))
+        if os.path.exists(cache_path):
+            self.hits += 1
+            with open(cache_path, "r", encoding="utf-8") as f:
+                for number, line in enumerate(f, 1):
+                    yield number, json.loads(line)
+            return
+
+        # fill the cache while streaming; only publish it once every page is in
+        self.misses += 1
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp = f"{cache_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        complete = False
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for number, text in enumerate(iter_extract(path), 1):
+                    f.write(json.dumps(text, ensure_ascii=False) + "\n")
+                    yield number, text
+            complete = True
+            os.replace(tmp, cache_path)
+        finally:
+            if not complete and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def get_pages(self, path):
+        return [text for _, text in self.iter_pages(path)]
+
+    def get_text(self, path):
+        return "\n".join(t for t in self.get_pages(path) if t)
@@ -1,3 +1,706 @@
-from django.test import TestCase
+import os
+import json
+import time
+import tempfile
+from datetime import timedelta
+import threading
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+import faiss
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from google.api_core.exceptions import ResourceExhausted
+from rest_framework.authtoken.models import Token
+
+from . import ann, jobs, llm_cache, llm_client, views
+from .chunk_store import ChunkStore
+from .chunking import iter_chunks
+from .hashing import text_sha256
+from .llm_cache import should_cache
+from .index_manager import IndexManager
+from .context import Context, merge_neighbours, mmr, pack
+from .embeddings import EMB_DIM
+from .llm_client import GeminiClient, RateLimited, TokenBucket
+from .microbatch import MicroBatcher
+from .models import IngestJob
+
+
+def unit_vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class AnnTests(SimpleTestCase):
+    def setUp(self):
+        self.vectors = unit_vectors(2000)
+        self.ids = np.arange(1000, 3000, dtype="int64")
+
+    def top1(self, index, row):
+        _, I = index.search(self.vectors[row:row + 1], 1)
+        return int(I[0][0])
+
+    def roundtrip(self, index):
+        path = os.path.join(tempfile.mkdtemp(), "index.faiss")
+        faiss.write_index(index, path)
+        return faiss.read_index(path)
+
+    def test_remove_then_search_and_compact(self):
+        removed_ids = self.ids[:100]
+        for kind in ("flat", "ivf", "hnsw"):
+            with self.subTest(kind=kind):
+                index = self.roundtrip(ann.build_index(kind, 16, self.vectors, self.ids))
+                removed = ann.remove_ids(index, removed_ids)
+                self.assertEqual(removed, 0 if kind == "hnsw" else 100)
+                # surviving vectors still map to their own ids
+                self.assertEqual(self.top1(index, 500), 1500)
+                self.assertEqual(self.top1(index, 1999), 2999)
+                if kind != "hnsw":
+                    self.assertNotIn(self.top1(index, 0), removed_ids)
+
+                compacted, dropped = ann.compact(index, self.ids[100:])
+                self.assertEqual(dropped, 0 if kind != "hnsw" else 100)
+                self.assertEqual(compacted.ntotal, 1900)
+                self.assertEqual(ann.index_kind(compacted), kind)
+                compacted = self.roundtrip(compacted)
+                self.assertEqual(self.top1(compacted, 500), 1500)
+                ids, _ = ann.all_vectors(compacted)
+                self.assertEqual(sorted(ids.tolist()), self.ids[100:].tolist())
+
+    def test_all_vectors_of_ivf_after_removal(self):
+        index = ann.build_index("ivf", 16, self.vectors, self.ids)
+        ann.remove_ids(index, [1000, 1001, 2500])
+        ids, vectors = ann.all_vectors(index)
+        order = np.argsort(ids)
+        expected = np.delete(np.arange(2000), [0, 1, 1500])
+        np.testing.assert_array_equal(ids[order], self.ids[expected])
+        np.testing.assert_allclose(vectors[order], self.vectors[expected])
+
+    def test_wrapped_ivf_keeps_vectors_until_compaction(self):
+        # indexes saved before IVF was built without IndexIDMap2
+        inner = faiss.IndexIVFFlat(faiss.IndexFlatIP(16), 16, 40, faiss.METRIC_INNER_PRODUCT)
+        inner.train(self.vectors)
+        index = faiss.IndexIDMap2(inner)
+        index.add_with_ids(self.vectors, self.ids)
+        self.assertEqual(ann.remove_ids(index, self.ids[:10]), 0)
+        compacted, dropped = ann.compact(index, self.ids[10:])
+        self.assertEqual(dropped, 10)
+        self.assertFalse(hasattr(compacted, "id_map"))
+        self.assertEqual(self.top1(compacted, 500), 1500)
+
+    def test_search_params_restrict_to_ids(self):
+        for kind in ("flat", "ivf", "hnsw"):
+            with self.subTest(kind=kind):
+                index = ann.build_index(kind, 16, self.vectors, self.ids)
+                allowed = self.ids[:50]
+                params = ann.search_params(index, ids=allowed)
+                _, I = index.search(self.vectors[1000:1001], 5, params=params)
+                self.assertTrue(set(I[0][I[0] >= 0].tolist()) <= set(allowed.tolist()))
+
+
+def failing_handler(job, progress):
+    progress("working", 1, 2)
+    raise ValueError(f"cannot index {job.payload['file']}")
+
+
+def echo_handler(job, progress):
+    return {"file": job.payload["file"]}
+
+
+class JobQueueTests(TestCase):
+    def test_a_job_is_claimed_once(self):
+        first = IngestJob.objects.create(kind="index_pdf", payload={"file": "a.pdf"})
+        second = IngestJob.objects.create(kind="index_pdf", payload={"file": "b.pdf"})
+        claimed = [jobs.claim_next(), jobs.claim_next(), jobs.claim_next()]
+        self.assertEqual([j and j.id for j in claimed], [first.id, second.id, None])
+        self.assertEqual(claimed[0].status, IngestJob.RUNNING)
+        self.assertIsNotNone(claimed[0].started_at)
+
+    def test_losing_the_claim_race_skips_to_the_next_job(self):
+        taken = IngestJob.objects.create(kind="index_pdf", payload={"file": "a.pdf"})
+        free = IngestJob.objects.create(kind="index_pdf", payload={"file": "b.pdf"})
+        update = IngestJob.objects.filter(id=taken.id).update
+
+        # another worker claims `taken` after this one has listed the candidates
+        def values_list(*args, **kwargs):
+            update(status=IngestJob.RUNNING)
+            return [taken.id, free.id]
+
+        with mock.patch("django.db.models.query.QuerySet.values_list", side_effect=values_list):
+            self.assertEqual(jobs.claim_next().id, free.id)
+
+    def test_failing_job_records_its_error(self):
+        job = IngestJob.objects.create(kind="index_pdf", payload={"file": "a.pdf"})
+        with mock.patch.dict(jobs.JOB_HANDLERS, {"index_pdf": f"{__name__}.failing_handler"}), \
+                self.assertLogs("ragapp.jobs", level="ERROR"):
+            jobs.run_job(jobs.claim_next())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.stage), (IngestJob.FAILED, "cannot index a.pdf", "working"))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_finished_job_stores_its_result(self):
+        job = IngestJob.objects.create(kind="index_pdf", payload={"file": "a.pdf"})
+        with mock.patch.dict(jobs.JOB_HANDLERS, {"index_pdf": f"{__name__}.echo_handler"}):
+            jobs.run_job(jobs.claim_next())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (IngestJob.DONE, {"file": "a.pdf"}))
+
+    def test_stale_running_jobs_are_requeued(self):
+        now = timezone.now()
+        stale = IngestJob.objects.create(kind="index_pdf", status=IngestJob.RUNNING,
+                                         started_at=now - timedelta(seconds=jobs.INGEST_STALE_AFTER + 60))
+        fresh = IngestJob.objects.create(kind="index_pdf", status=IngestJob.RUNNING, started_at=now)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.stage), (IngestJob.QUEUED, "requeued"))
+        self.assertEqual(fresh.status, IngestJob.RUNNING)
+        self.assertEqual(jobs.claim_next().id, stale.id)
+
+
+class DeleteEndpointTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.store = ChunkStore(os.path.join(tmp, "chunks.sqlite3"))
+        self.index_manager = IndexManager(os.path.join(tmp, "index.faiss"), 16)
+        for patcher in (
+            mock.patch.object(views, "chunk_store", self.store),
+            mock.patch.object(views, "index_manager", self.index_manager),
+            mock.patch.object(views.jobs, "enqueue", return_value=mock.Mock(id=1)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user("alice", password="x")
+        self.bob = User.objects.create_user("bob", password="x")
+        self.admin = User.objects.create_user("admin", password="x", is_staff=True)
+        self.docs = {}
+        for n, owner in enumerate((self.alice, self.bob)):
+            ids = self.store.append([{"text": f"{owner.username} chunk {i}", "source": "cs",
+                                      "file": f"{owner.username}.pdf"} for i in range(3)])
+            self.store.add_document(f"hash-{n}", f"{owner.username}.pdf", "cs", ids, owner.id)
+            self.docs[owner.username] = ids
+        with self.index_manager.writing() as index:
+            all_ids = self.docs["alice"] + self.docs["bob"]
+            index.add_with_ids(unit_vectors(len(all_ids)), np.array(all_ids, dtype="int64"))
+
+    def auth(self, user):
+        return {"HTTP_AUTHORIZATION": "Token " + Token.objects.get_or_create(user=user)[0].key}
+
+    def test_delete_requires_token(self):
+        response = self.client.delete("/api/documents/source/cs/")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.store.count(), 6)
+
+    def test_delete_is_scoped_to_the_caller(self):
+        response = self.client.delete("/api/documents/source/cs/", **self.auth(self.alice))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["documents_deleted"], 1)
+        self.assertEqual(self.store.live_ids().tolist(), self.docs["bob"])
+        self.assertEqual(self.index_manager.stats()["vectors"], 3)
+
+    def test_global_delete_is_staff_only(self):
+        response = self.client.delete("/api/documents/source/cs/?all=1", **self.auth(self.bob))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.delete("/api/documents/source/cs/?all=1", **self.auth(self.admin))
+        self.assertEqual(response.json()["documents_deleted"], 2)
+        self.assertEqual(self.store.count(), 0)
+
+    def test_compact_is_staff_only(self):
+        self.assertEqual(self.client.post("/api/compact/").status_code, 401)
+        self.assertEqual(self.client.post("/api/compact/", **self.auth(self.bob)).status_code, 403)
+        self.assertEqual(self.client.post("/api/compact/", **self.auth(self.admin)).status_code, 202)
+
+
+class ScopeSearchTests(SimpleTestCase):
+    def test_exact_scope_vectors_are_loaded_once_per_generation(self):
+        vectors = unit_vectors(50)
+        store = mock.Mock()
+        store.vectors_for_ids.side_effect = lambda ids: (np.asarray(ids), vectors[np.asarray(ids)])
+        scope = np.arange(10, 30, dtype="int64")
+        with mock.patch.object(views, "chunk_store", store), \
+                mock.patch.object(views, "scope_cache", views.TTLCache(4, 60)):
+            for _ in range(3):
+                self.assertEqual(views.search_scope(vectors[12], 3, scope, key=("scope", 1))[0], 12)
+            self.assertEqual(store.vectors_for_ids.call_count, 1)
+            views.search_scope(vectors[12], 3, scope, key=("scope", 2))
+            self.assertEqual(store.vectors_for_ids.call_count, 2)
+
+
+def stub_embed(texts):
+    """Deterministic stand-in for the sentence embedder."""
+    out = []
+    for text in texts:
+        seed = int(text_sha256(text)[:8], 16)
+        out.append(unit_vectors(1, EMB_DIM, seed)[0])
+    return np.array(out, dtype="float32")
+
+
+def pages_of(tag, n_pages):
+    return [(p, " ".join(f"{tag} page {p} sentence {i} " + "filler " * 30 + "end." for i in range(12)))
+            for p in range(1, n_pages + 1)]
+
+
+class IndexPdfJobTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = ChunkStore(os.path.join(self.tmp, "chunks.sqlite3"))
+        self.index_manager = IndexManager(os.path.join(self.tmp, "index.faiss"), EMB_DIM)
+        self.pages = {}
+        self.embed = mock.Mock(side_effect=stub_embed)
+        text_cache = mock.Mock(iter_pages=lambda path: iter(self.pages[path]))
+        for patcher in (
+            mock.patch.object(views, "chunk_store", self.store),
+            mock.patch.object(views, "index_manager", self.index_manager),
+            mock.patch.object(views, "text_cache", text_cache),
+            mock.patch.object(views, "page_count", lambda path: len(self.pages[path])),
+            mock.patch.object(views, "embed_texts", self.embed),
+            # small groups, so a job spans several append/embed rounds
+            mock.patch.object(views, "EMBED_BATCH_SIZE", 2),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, name, pages, owner_id=None):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w") as f:
+            f.write(json.dumps(pages))
+        self.pages[path] = pages
+        job = mock.Mock(payload={"path": path, "file": name, "source": "cs", "owner_id": owner_id})
+        return views.index_pdf_job(job, lambda *args: None)
+
+    def vectors(self):
+        return self.index_manager.stats()["vectors"]
+
+    def test_indexes_every_unique_chunk_once(self):
+        pages = pages_of("a", 4)
+        chunks = list(iter_chunks(pages))
+        result = self.upload("a.pdf", pages)
+        self.assertEqual(result["chunks"], len(chunks))
+        self.assertEqual(result["new_vectors"], len({c.text for c in chunks}))
+        self.assertEqual(self.vectors(), result["new_vectors"])
+        self.assertEqual(self.store.count(), result["new_vectors"])
+        document = self.store.find_document(views.file_sha256(os.path.join(self.tmp, "a.pdf")))
+        self.assertEqual(document["id"], result["document_id"])
+        self.assertEqual(len(document["chunk_ids"]), result["new_vectors"])
+        # nothing is left pending once the job is done
+        self.assertEqual(len(self.store.ids_for_hashes([text_sha256(c.text) for c in chunks])),
+                         result["new_vectors"])
+
+    def test_reuploads_and_shared_chunks_reuse_vectors(self):
+        first = self.upload("a.pdf", pages_of("a", 3))
+        again = self.upload("copy-of-a.pdf", pages_of("a", 3), owner_id=7)
+        self.assertEqual(again["duplicate_of"], first["document_id"])
+        self.assertEqual(again["new_vectors"], 0)
+        self.assertEqual(self.store.scope_ids(owner_id=7).tolist(), self.store.live_ids().tolist())
+
+        embedded_before = self.embed.call_count
+        mixed = self.upload("b.pdf", pages_of("a", 3) + pages_of("b", 2)[:1])
+        self.assertNotIn("duplicate_of", mixed)
+        self.assertEqual(self.vectors(), first["new_vectors"] + mixed["new_vectors"])
+        self.assertLess(mixed["new_vectors"], mixed["chunks"])
+        self.assertEqual(mixed["embedded"], mixed["new_vectors"])
+        self.assertGreater(self.embed.call_count, embedded_before)
+
+    def test_failed_embedding_rolls_back_without_touching_other_documents(self):
+        first = self.upload("a.pdf", pages_of("a", 2))
+        live = self.store.live_ids().tolist()
+        calls = []
+
+        def flaky(texts):
+            calls.append(len(texts))
+            if len(calls) == 2:
+                raise RuntimeError("embedder crashed")
+            return stub_embed(texts)
+
+        self.embed.side_effect = flaky
+        with self.assertRaises(RuntimeError):
+            self.upload("b.pdf", pages_of("a", 2) + pages_of("b", 40))
+        # the first group's new rows were appended, then removed again
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.store.live_ids().tolist(), live)
+        self.assertEqual(self.vectors(), first["new_vectors"])
+        self.assertEqual(len(self.store.find_document(views.file_sha256(
+            os.path.join(self.tmp, "a.pdf")))["chunk_ids"]), first["new_vectors"])
+
+
+class IndexManagerTests(SimpleTestCase):
+    def test_writers_in_different_processes_do_not_lose_vectors(self):
+        # two managers on one file stand in for two worker processes
+        path = os.path.join(tempfile.mkdtemp(), "index.faiss")
+        managers = [IndexManager(path, 16), IndexManager(path, 16)]
+        for manager in managers:
+            manager.refresh()
+        vectors = unit_vectors(10)
+
+        def add(n):
+            with managers[n % 2].writing() as index:
+                time.sleep(0.05)  # widen the load -> save window
+                index.add_with_ids(vectors[n:n + 1], np.array([n], dtype="int64"))
+
+        threads = [threading.Thread(target=add, args=(n,)) for n in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(faiss.read_index(path).ntotal, 10)
+
+
+class ChunkStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = ChunkStore(os.path.join(tempfile.mkdtemp(), "chunks.sqlite3"))
+
+    def add_document(self, texts, source, file, owner_id=None):
+        """Upload-style add: reuse live chunks with the same text, append the rest."""
+        hashes = [text_sha256(t) for t in texts]
+        existing = self.store.ids_for_hashes(hashes)
+        new = list(dict.fromkeys(t for t, h in zip(texts, hashes) if h not in existing))
+        new_ids = dict(zip(new, self.store.append([{"text": t, "source": source, "file": file} for t in new])))
+        ids = [existing.get(h) or new_ids[t] for t, h in zip(texts, hashes)]
+        self.store.add_document(f"hash-{file}", file, source, ids, owner_id)
+        return ids
+
+    def test_scope_follows_documents_not_first_uploader(self):
+        shared = self.add_document(["shared one.", "shared two."], "cs", "a.pdf")
+        other = self.add_document(["shared one.", "shared two.", "math only."], "math", "b.pdf")
+        self.assertEqual(other[:2], shared)
+        self.assertEqual(self.store.scope_ids(source="math").tolist(), sorted(other))
+        self.assertEqual(self.store.scope_ids(source="cs").tolist(), shared)
+
+        self.store.delete_documents(source="cs")
+        # the shared chunks still carry source "cs" but now only belong to math
+        self.assertEqual(self.store.scope_ids(source="cs").tolist(), [])
+        self.assertEqual(self.store.scope_ids(source="math").tolist(), sorted(other))
+
+    def test_duplicate_chunks_reuse_ids(self):
+        first = self.add_document(["alpha.", "beta.", "alpha."], "cs", "a.pdf")
+        self.assertEqual(first[0], first[2])
+        second = self.add_document(["beta.", "gamma."], "cs", "b.pdf")
+        self.assertEqual(second[0], first[1])
+        self.assertEqual(self.store.count(), 3)
+        self.assertEqual(self.store.find_document("hash-a.pdf")["chunk_ids"], sorted(set(first)))
+
+    def test_delete_keeps_shared_chunks_and_tombstones_the_rest(self):
+        a = self.add_document(["shared.", "only a."], "cs", "a.pdf", owner_id=1)
+        b = self.add_document(["shared.", "only b."], "cs", "b.pdf", owner_id=2)
+        n_docs, tombstoned = self.store.delete_documents(owner_id=1)
+        self.assertEqual((n_docs, tombstoned), (1, [a[1]]))
+        self.assertEqual(self.store.live_ids().tolist(), sorted(b))
+        self.assertEqual(self.store.lookup(a), [self.store.lookup([a[0]])[0]])
+        self.assertEqual(self.store.tombstone_count(), 1)
+        # a deleted chunk's text comes back as a new chunk, not the tombstone
+        again = self.add_document(["only a."], "cs", "c.pdf")
+        self.assertNotEqual(again[0], a[1])
+
+    def test_pending_chunks_are_not_reused_until_indexed(self):
+        h = text_sha256("fresh.")
+        (pending,) = self.store.append([{"text": "fresh.", "source": "cs"}], pending=True)
+        self.assertEqual(self.store.ids_for_hashes([h]), {})
+        self.assertEqual(self.store.scope_ids(source="cs").tolist(), [])
+        self.store.mark_indexed([pending])
+        self.assertEqual(self.store.ids_for_hashes([h]), {h: pending})
+
+    def test_purged_ids_are_never_reused(self):
+        ids = self.add_document(["one.", "two."], "cs", "a.pdf")
+        self.store.delete_documents(file="a.pdf")
+        self.assertEqual(self.store.purge_deleted(), 2)
+        self.assertEqual(self.store.count() + self.store.tombstone_count(), 0)
+        self.assertGreater(self.store.append([{"text": "three."}])[0], max(ids))
+
+    def test_scope_by_owner(self):
+        mine = self.add_document(["mine."], "cs", "a.pdf", owner_id=1)
+        self.add_document(["theirs."], "cs", "b.pdf", owner_id=2)
+        self.assertEqual(self.store.scope_ids(owner_id=1).tolist(), mine)
+        self.assertEqual(self.store.scope_ids(owner_id=1, source="math").tolist(), [])
+
+
+class ChunkingTests(SimpleTestCase):
+    def sentences(self, n, words=9):
+        return " ".join(f"Sentence {i} " + "word " * (words - 3) + "end." for i in range(n))
+
+    def test_chunks_stay_within_budget_and_break_between_sentences(self):
+        chunks = list(iter_chunks([(1, self.sentences(40))], max_tokens=50, overlap_tokens=10))
+        self.assertGreater(len(chunks), 5)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk.text.split()), 50)
+            self.assertTrue(chunk.text.startswith("Sentence "))
+            self.assertTrue(chunk.text.endswith("end."))
+        # consecutive chunks share their trailing sentence (9 tokens <= 10 overlap)
+        self.assertEqual(chunks[0].text.split()[-9:], chunks[1].text.split()[:9])
+
+    def test_long_sentences_are_split_on_words(self):
+        chunks = list(iter_chunks([(1, "word " * 130 + "end.")], max_tokens=50, overlap_tokens=0))
+        self.assertEqual([len(c.text.split()) for c in chunks], [50, 50, 31])
+
+    def test_page_ranges(self):
+        pages = [(1, self.sentences(3)), (2, "This sentence starts on page two"), (3, "and ends on page three.")]
+        chunks = list(iter_chunks(pages, max_tokens=500))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual((chunks[0].page_start, chunks[0].page_end), (1, 3))
+        self.assertIn("page two and ends", chunks[0].text)
+
+        chunks = list(iter_chunks([(1, self.sentences(5)), (2, self.sentences(5))], max_tokens=45, overlap_tokens=0))
+        self.assertEqual([(c.page_start, c.page_end) for c in chunks], [(1, 1), (2, 2)])
+
+
+def words(prefix, n):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+class ContextPackingTests(SimpleTestCase):
+    def item(self, id, text, file="a.pdf", pages=(1, 1)):
+        return {"id": id, "text": text, "file": file, "source": "cs", "page_start": pages[0], "page_end": pages[1]}
+
+    def test_overlapping_neighbours_merge_once(self):
+        first = self.item(7, words("w", 60), pages=(1, 1))
+        second = self.item(8, words("w", 60)[len(words("w", 40)) + 1:] + " " + words("x", 30), pages=(1, 2))
+        (passage,) = merge_neighbours([second, first])
+        self.assertEqual(passage["ids"], [7, 8])
+        self.assertEqual((passage["page_start"], passage["page_end"]), (1, 2))
+        self.assertEqual(passage["tokens"], words("w", 60).split() + words("x", 30).split())
+
+    def test_consecutive_ids_are_not_enough_to_merge(self):
+        # a deduplicated chunk from another upload can sit next to any id
+        left = self.item(7, words("w", 20), pages=(1, 1))
+        far = self.item(8, words("w", 20)[len(words("w", 15)) + 1:] + " tail", pages=(9, 9))
+        other_file = self.item(9, words("w", 20)[len(words("w", 15)) + 1:] + " tail", file="b.pdf")
+        unrelated = self.item(10, "no shared words here", pages=(1, 1))
+        self.assertEqual(len(merge_neighbours([left, far, other_file, unrelated])), 4)
+
+    def test_mmr_drops_near_duplicates(self):
+        vectors = unit_vectors(3)
+        vectors = np.vstack([vectors[0], vectors[0], vectors[1], vectors[2]])
+        picked = mmr(vectors[0], vectors, 4)
+        self.assertEqual(len(picked), 3)
+        self.assertEqual(picked[0], 0)
+        self.assertNotIn(1, picked)
+
+    def test_exact_duplicates_are_dropped_without_vectors(self):
+        items = [self.item(1, "same text."), self.item(2, "same text.", file="b.pdf"), self.item(3, "other.")]
+        context = pack(items, None, {}, k=3)
+        self.assertEqual([p["id"] for p in context.passages], [1, 3])
+
+    def test_budget_truncates_the_last_passage(self):
+        items = [self.item(1, words("a", 100)), self.item(2, words("b", 100), file="b.pdf"),
+                 self.item(3, words("c", 100), file="c.pdf")]
+        context = pack(items, None, {}, k=3, budget=160)
+        self.assertEqual(context.tokens, 160)
+        self.assertEqual([p["id"] for p in context.passages], [1, 2])
+        self.assertTrue(context.text.endswith("b59"))
+        # too little room left for a useful passage: stop instead of adding a stub
+        self.assertEqual(len(pack(items, None, {}, k=3, budget=120).passages), 1)
+
+    def test_tokens_saved_is_never_negative(self):
+        # MMR skips the duplicate top hit and picks the long third item instead
+        vectors = unit_vectors(2)
+        items = [self.item(1, "short one."), self.item(2, "short two.", file="b.pdf"),
+                 self.item(3, words("long", 200), file="c.pdf")]
+        vectors_by_id = {1: vectors[0], 2: vectors[0], 3: vectors[1]}
+        context = pack(items, vectors[0], vectors_by_id, k=2)
+        self.assertEqual([p["id"] for p in context.passages], [1, 3])
+        self.assertGreaterEqual(views.context_report(context)["tokens_saved"], 0)
+
+        overlapping = [self.item(1, words("w", 60)), self.item(2, words("w", 60)[len(words("w", 40)) + 1:])]
+        context = pack(overlapping, None, {}, k=2)
+        self.assertEqual((context.naive_tokens, context.tokens), (80, 60))
+
+
+class GenerateFlashcardsTests(SimpleTestCase):
+    def test_uses_default_config_and_skips_the_cache(self):
+        reply = '[{"question": "q", "answer": "a"}]'
+        with mock.patch.object(views.llm, "generate", return_value=reply) as generate, \
+                mock.patch.object(views, "llm_cache") as cache:
+            request = RequestFactory().post("/", '{"topic": "pointers"}', content_type="application/json")
+            response = views.generate_flashcards(request)
+        self.assertEqual(json.loads(response.content), {"flashcards": [{"question": "q", "answer": "a"}]})
+        prompt, model, config = generate.call_args.args
+        self.assertIn("'pointers'", prompt)
+        self.assertEqual(config, {})
+        cache.get.assert_not_called()
+        cache.set.assert_not_called()
+
+
+def fake_model(generate_content):
+    return mock.Mock(generate_content=mock.Mock(side_effect=generate_content))
+
+
+def chunk(text):
+    return mock.Mock(parts=[text], text=text)
+
+
+class GeminiClientTests(SimpleTestCase):
+    def test_stream_frees_its_slot_once_the_response_starts(self):
+        client = GeminiClient(max_concurrency=1, tpm=0)
+
+        def generate_content(prompt, generation_config, stream=False):
+            return iter([chunk("a"), chunk("b")]) if stream else mock.Mock(text="answer")
+
+        with mock.patch.object(client, "model", return_value=fake_model(generate_content)):
+            pieces = client.stream("p", "m", {})
+            self.assertEqual(next(pieces), "a")
+            # the reader is paused mid-stream; the only slot must be free again
+            answers = []
+            other = threading.Thread(target=lambda: answers.append(client.generate("p", "m", {})), daemon=True)
+            other.start()
+            other.join(timeout=5)
+            self.assertEqual(answers, ["answer"])
+            self.assertEqual(list(pieces), ["b"])
+
+    def test_rate_limits_are_retried_with_jittered_backoff(self):
+        client = GeminiClient(tpm=0, max_retries=3, backoff_base=1.0, backoff_max=1.5)
+        replies = [ResourceExhausted("quota"), ResourceExhausted("quota"), mock.Mock(text="ok")]
+
+        def generate_content(prompt, generation_config):
+            reply = replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+        with mock.patch.object(client, "model", return_value=fake_model(generate_content)), \
+                mock.patch.object(llm_client, "time") as fake_time:
+            self.assertEqual(client.generate("p", "m", {}), "ok")
+        delays = [c.args[0] for c in fake_time.sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 1.5)
+        self.assertEqual((client.stats()["calls"], client.stats()["retries"]), (3, 2))
+
+    def test_backoff_is_full_jitter_up_to_the_cap(self):
+        client = GeminiClient(tpm=0, backoff_base=1.0, backoff_max=8)
+        for attempt in range(6):
+            delays = [client._backoff(attempt) for _ in range(200)]
+            cap = min(8, 2 ** attempt)
+            self.assertTrue(all(0 <= d <= cap for d in delays))
+            self.assertGreater(max(delays) - min(delays), cap / 4)
+
+    def test_gives_up_with_rate_limited(self):
+        client = GeminiClient(tpm=0, max_retries=2)
+        model = fake_model(ResourceExhausted("quota"))
+        with mock.patch.object(client, "model", return_value=model), mock.patch.object(llm_client, "time"):
+            self.assertRaises(RateLimited, client.generate, "p", "m", {})
+            self.assertRaises(RateLimited, lambda: list(client.stream("p", "m", {})))
+        self.assertEqual(model.generate_content.call_count, 6)
+        self.assertEqual(client.stats()["rate_limited"], 2)
+
+    def test_token_bucket_waits_for_refill(self):
+        clock = [100.0]
+        with mock.patch.object(llm_client, "time") as fake_time:
+            fake_time.monotonic.side_effect = lambda: clock[0]
+            fake_time.sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+            bucket = TokenBucket(60)
+            self.assertEqual(bucket.acquire(60), 0.0)
+            self.assertAlmostEqual(bucket.acquire(30), 30.0)
+            # requests above the capacity are clamped, not stuck forever
+            self.assertAlmostEqual(bucket.acquire(600), 60.0)
+
+    def test_rate_limited_is_a_503(self):
+        context = Context("context", [], 1, 1)
+        with mock.patch.object(views, "build_context", return_value=context), \
+                mock.patch.object(views.llm, "generate", side_effect=RateLimited("quota")):
+            response = self.client.post("/api/chat/", json.dumps({"question": "q", "cache": False}),
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "30")
+
+
+class LLMCacheDefaultsTests(SimpleTestCase):
+    def test_generation_calls_are_not_cached_by_default(self):
+        context = Context("context", [], 1, 1)
+        body = json.dumps({"prompt": "loops", "count": 3})
+        with mock.patch.object(views, "build_context", return_value=context), \
+                mock.patch.object(views.chunk_store, "first", return_value={"text": "t"}), \
+                mock.patch.object(views, "llm_cache") as cache, \
+                mock.patch.object(views.llm, "generate", side_effect=["first set", "second set"]):
+            answers = [self.client.post("/api/generate_questions/", body, content_type="application/json")
+                       .json()["questions"] for _ in range(2)]
+        self.assertEqual(answers, ["first set", "second set"])
+        cache.get.assert_not_called()
+
+    def test_low_temperature_and_explicit_opt_in_are_cached(self):
+        with mock.patch.object(llm_cache, "LLM_CACHE_ENABLED", True):
+            self.assertTrue(should_cache(0.3))
+            self.assertFalse(should_cache(0.4))
+            self.assertTrue(should_cache(0.6, cache=True))
+            self.assertFalse(should_cache(0.2, cache=False))
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_each_caller_gets_its_own_result(self):
+        batcher = MicroBatcher(lambda items: [i * 2 for i in items], max_wait_ms=20)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            self.assertEqual(list(pool.map(batcher.submit, range(40))), [i * 2 for i in range(40)])
+
+    def test_short_result_list_fails_every_caller(self):
+        batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=50)
+        started = threading.Barrier(4)
+        outcomes = []
+
+        def call(i):
+            started.wait()
+            try:
+                batcher.submit(i)
+                outcomes.append("ok")
+            except RuntimeError:
+                outcomes.append("error")
+
+        threads = [threading.Thread(target=call, args=(i,), daemon=True) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+        # nobody hangs; every caller of a short batch sees the error
+        self.assertEqual(outcomes, ["error"] * 4)
+
+    def test_exception_results_only_fail_their_caller(self):
+        batcher = MicroBatcher(lambda items: [ValueError(i) if i == 3 else i for i in items], max_wait_ms=20)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = {i: pool.submit(batcher.submit, i) for i in range(8)}
+        self.assertRaises(ValueError, futures[3].result)
+        self.assertEqual([futures[i].result() for i in range(8) if i != 3], [0, 1, 2, 4, 5, 6, 7])
+
+    def test_failing_search_group_only_fails_its_callers(self):
+        def search(vectors, k, nprobe=None, ef_search=None):
+            if nprobe == "x":
+                raise ValueError("invalid literal for int()")
+            return None, np.tile(np.arange(k), (len(vectors), 1))
+
+        q = unit_vectors(1)[0]
+        with mock.patch.object(views, "index_manager", mock.Mock(search=search)):
+            results = views._search_batch([(q, 3, None, None), (q, 3, "x", None), (q, 2, None, None)])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual([r.tolist() for r in (results[0], results[2])], [[0, 1, 2], [0, 1]])
+
+
+class SearchOptionsTests(SimpleTestCase):
+    def test_parses_positive_ints_within_limits(self):
+        self.assertEqual(views.search_options({"nprobe": "8", "ef_search": 128}),
+                         {"nprobe": 8, "ef_search": 128, "max_context_tokens": None})
+        for body in ({"nprobe": "x"}, {"nprobe": 0}, {"ef_search": -5}, {"nprobe": 10 ** 9},
+                     {"max_context_tokens": [1]}, {"max_context_tokens": 2.5}, {"ef_search": True}):
+            with self.subTest(body=body):
+                self.assertRaises(ValueError, views.search_options, body)
+
+    def test_bad_values_are_a_400(self):
+        with mock.patch.object(views, "build_context") as build_context:
+            for url in ("/api/chat/", "/api/generate_questions/"):
+                response = self.client.post(url, json.dumps({"question": "q", "nprobe": "x"}),
+                                            content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("nprobe", response.json()["error"])
+        build_context.assert_not_called()
+
+
+class WantsStreamTests(SimpleTestCase):
+    def test_parses_explicit_values(self):
+        factory = RequestFactory()
+        plain = factory.post("/")
+        sse = factory.post("/", HTTP_ACCEPT="text/event-stream")
+        for value, expected in ((True, True), (False, False), (1, True), (0, False),
+                                ("1", True), ("true", True), ("0", False), ("false", False), ("no", False)):
+            with self.subTest(value=value):
+                self.assertIs(views.wants_stream(plain, {"stream": value}), expected)
+                self.assertIs(views.wants_stream(sse, {"stream": value}), expected)
+        self.assertFalse(views.wants_stream(plain, {}))
+        self.assertTrue(views.wants_stream(sse, {}))
+        self.assertFalse(views.wants_stream(plain, factory.post("/", {"stream": "0"}).POST))
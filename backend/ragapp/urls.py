@@ -6,4 +6,9 @@ urlpatterns = [
     path("upload_pdf/", views.upload_pdf),
     path("chat/", views.chat),
     path("generate_questions/", views.generate_questions),
+    path("index_stats/", views.index_stats),
+    path("jobs/<int:job_id>/", views.job_status),
+    path("documents/file/<str:name>/", views.delete_by_file),
+    path("documents/source/<str:source>/", views.delete_by_source),
+    path("compact/", views.compact_index),
 ]
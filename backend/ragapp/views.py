@@ -4,70 +4,220 @@ from django.shortcuts import render
 # ragapp/views.py
 import os
 import json
+import time
+import hashlib
 import numpy as np
-import faiss
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
 from django.utils import timezone
-from PyPDF2 import PdfReader
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
 
-# --- CONFIG ---
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from .index_manager import IndexManager
+from .chunk_store import ChunkStore
+from .hashing import file_sha256, text_sha256
+from .pdf_text import TextCache, page_count
+from .chunking import iter_chunks
+from .embeddings import EMB_DIM, EMBED_BATCH_SIZE, EMBED_POOL_MIN_CHUNKS, embed_texts
+from .models import IngestJob
+from .query_cache import TTLCache
+from .context import CONTEXT_TOKENS, MMR_FETCH_FACTOR, pack
+from .llm_cache import LLMCache, cache_key, should_cache
+from .llm_client import RateLimited, client as llm
+from .auth import token_cache, user_from_request
+from .microbatch import MicroBatcher
+from . import ann, jobs
 
+# --- CONFIG ---
 FAISS_DIR = os.path.join(settings.BASE_DIR, "faiss_index")
 os.makedirs(FAISS_DIR, exist_ok=True)
 INDEX_PATH = os.path.join(FAISS_DIR, "index.faiss")
-META_PATH = os.path.join(FAISS_DIR, "meta.json")
-
-# embedding model
-embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-EMB_DIM = embedder.get_sentence_embedding_dimension()
+META_PATH = os.path.join(FAISS_DIR, "meta.json")  # legacy, imported into CHUNKS_PATH
+CHUNKS_PATH = os.path.join(FAISS_DIR, "chunks.sqlite3")
+
+# shared, process-resident index (loaded lazily on first use)
+index_manager = IndexManager(INDEX_PATH, EMB_DIM)
+chunk_store = ChunkStore(CHUNKS_PATH, legacy_json=META_PATH)
+# extracted PDF text, shared with studyapp through extract_text_from_pdf
+text_cache = TextCache(os.path.join(settings.BASE_DIR, "text_cache"))
+
+# question -> embedding and (embedding, index generation, k, ...) -> chunk ids
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = int(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))
+embedding_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+retrieval_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+# (model, prompt, generation config) -> response text, shared across workers
+llm_cache = LLMCache(os.path.join(settings.BASE_DIR, "llm_cache.sqlite3"))
+
+# compact once tombstoned chunks reach this count or this share of all chunks
+COMPACT_MIN_TOMBSTONES = int(os.getenv("RAG_COMPACT_MIN_TOMBSTONES", "1000"))
+COMPACT_TOMBSTONE_RATIO = float(os.getenv("RAG_COMPACT_TOMBSTONE_RATIO", "0.2"))
+
+# scopes up to this many chunks are searched exactly over their own vectors.
+# Loading them from SQLite costs ~12 ms per 1000 chunks (384-d), against
+# 1-2 ms for a selector search, so the matrices are cached per scope and
+# index generation; 2000 chunks is ~3 MB per cached scope.
+SCOPE_EXACT_MAX = int(os.getenv("RAG_SCOPE_EXACT_MAX", "2000"))
+SCOPE_CACHE_SIZE = int(os.getenv("RAG_SCOPE_CACHE_SIZE", "32"))
+# (scope, index generation) -> (ids, vectors) for exact scope search
+scope_cache = TTLCache(SCOPE_CACHE_SIZE, QUERY_CACHE_TTL)
+
+# upper limits for the per-request search and context knobs
+MAX_NPROBE = int(os.getenv("RAG_MAX_NPROBE", "1024"))
+MAX_EF_SEARCH = int(os.getenv("RAG_MAX_EF_SEARCH", "1024"))
+MAX_CONTEXT_TOKENS = int(os.getenv("RAG_MAX_CONTEXT_TOKENS", "8000"))
 
 # --- HELPERS ---
-def load_or_create_index():
-    if os.path.exists(INDEX_PATH) and os.path.exists(META_PATH):
-        index = faiss.read_index(INDEX_PATH)
-        with open(META_PATH, "r", encoding="utf-8") as f:
-            meta = json.load(f)
-        return index, meta
-    else:
-        index = faiss.IndexIDMap2(faiss.IndexFlatIP(EMB_DIM))
-        meta = {"next_id": 1, "items": {}}
-        return index, meta
-
-def save_index_meta(index, meta):
-    faiss.write_index(index, INDEX_PATH)
-    with open(META_PATH, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-
 def extract_text_from_pdf(path):
-    reader = PdfReader(path)
-    text = []
-    for page in reader.pages:
-        t = page.extract_text()
-        if t:
-            text.append(t)
-    return "\n".join(text)
+    return text_cache.get_text(path)
 
 def chunk_text(text, chunk_size=500, overlap=80):
-    tokens = text.split()
-    chunks = []
-    i = 0
-    while i < len(tokens):
-        chunk = tokens[i:i+chunk_size]
-        chunks.append(" ".join(chunk))
-        i += chunk_size - overlap
-    return chunks
-
-def create_embedding(text):
-    vec = embedder.encode([text], normalize_embeddings=True)[0]
-    return np.array(vec, dtype="float32")
-
-def gemini_chat(messages, model="gemini-1.5-flash", max_output_tokens=500, temperature=0.3):
+    return [c.text for c in iter_chunks([(1, text)], chunk_size, overlap)]
+
+def _search_batch(requests):
+    # requests: (vector, k, nprobe, ef_search); one index.search per distinct setting.
+    # A failing search only fails the callers that share its setting.
+    results = [None] * len(requests)
+    groups = {}
+    for pos, (vec, *params) in enumerate(requests):
+        groups.setdefault(tuple(params), []).append(pos)
+    for (k, nprobe, ef_search), positions in groups.items():
+        try:
+            vectors = np.vstack([requests[pos][0] for pos in positions])
+            D, I = index_manager.search(vectors, k, nprobe=nprobe, ef_search=ef_search)
+        except Exception as e:
+            for pos in positions:
+                results[pos] = e
+            continue
+        for row, pos in enumerate(positions):
+            results[pos] = I[row]
+    return results
+
+# concurrent chat requests share one encode() and one index.search()
+query_embedder = MicroBatcher(lambda texts: list(embed_texts(texts)), name="query-embedder")
+# searches are cheap: batch whatever is already queued, never wait for more
+query_searcher = MicroBatcher(_search_batch, max_wait_ms=0, name="query-searcher")
+
+def embed_query(text):
+    # MiniLM is uncased, so case/whitespace variants share one embedding
+    key = text_sha256(text.lower())
+    vec = embedding_cache.get(key)
+    if vec is None:
+        vec = query_embedder.submit(text)
+        embedding_cache.set(key, vec)
+    return vec
+
+def resolve_scope(request, data):
+    """Chunk ids a query may search, or None for the whole index.
+
+    `scope` is "all" (default), "mine" (the caller's uploads; needs a token) or
+    an object with any of "mine", "source" and "file".
+    Raises PermissionError / ValueError for the views to turn into 401 / 400.
+    """
+    scope = data.get("scope") or "all"
+    if scope == "all":
+        return None
+    if scope == "mine":
+        scope = {"mine": True}
+    if not isinstance(scope, dict):
+        raise ValueError("scope must be 'all', 'mine' or an object with mine/source/file")
+    owner_id = None
+    if scope.get("mine"):
+        user = user_from_request(request)
+        if user is None:
+            raise PermissionError("Unauthorized (provide Token header)")
+        owner_id = user.id
+    source, file_name = scope.get("source"), scope.get("file")
+    if owner_id is None and source is None and file_name is None:
+        return None
+    return chunk_store.scope_ids(owner_id=owner_id, source=source, file=file_name)
+
+def _positive_int(data, name, limit):
+    value = data.get(name)
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{name} must be an integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if not 1 <= value <= limit:
+        raise ValueError(f"{name} must be between 1 and {limit}")
+    return value
+
+def search_options(data):
+    """The optional nprobe / ef_search / max_context_tokens of a request body,
+    as ints within their limits (None when absent). Raises ValueError."""
+    return {
+        "nprobe": _positive_int(data, "nprobe", MAX_NPROBE),
+        "ef_search": _positive_int(data, "ef_search", MAX_EF_SEARCH),
+        "max_context_tokens": _positive_int(data, "max_context_tokens", MAX_CONTEXT_TOKENS),
+    }
+
+def scope_vectors(scope_ids, key):
+    """(ids, vectors) of a small scope, loaded once per `key`."""
+    entry = scope_cache.get(key)
+    if entry is None:
+        entry = chunk_store.vectors_for_ids(scope_ids)
+        scope_cache.set(key, entry)
+    return entry
+
+def search_scope(q_emb, k, scope_ids, nprobe=None, ef_search=None, key=None):
+    """Top-k ids within a scope. Small scopes are ranked exactly over their
+    cached embeddings, so cost follows the scope size and IVF/HNSW recall is not
+    an issue; larger ones search the main index through an ID selector.
+    `key` identifies the scope and index generation for scope_cache."""
+    if len(scope_ids) <= SCOPE_EXACT_MAX:
+        ids, vectors = scope_vectors(scope_ids, key) if key else chunk_store.vectors_for_ids(scope_ids)
+        # chunks imported without an embedding fall through to the index
+        if len(ids) == len(scope_ids):
+            scores = vectors @ q_emb
+            top = np.argsort(-scores, kind="stable")[:k]
+            return [int(ids[i]) for i in top]
+    D, I = index_manager.search(q_emb[None, :], k, nprobe=nprobe, ef_search=ef_search, ids=scope_ids)
+    return [int(i) for i in I[0] if i >= 0]
+
+def retrieve(text, k, nprobe=None, ef_search=None, scope_ids=None):
+    """Top-k chunk items for a query, optionally limited to `scope_ids`.
+    Cached results are keyed on the index generation and the scope, so any
+    upload or reload invalidates them automatically."""
+    if scope_ids is not None and not len(scope_ids):
+        return []
+    q_emb = embed_query(text)
+    generation = index_manager.refresh()
+    scope_key = hashlib.sha1(scope_ids.tobytes()).hexdigest() if scope_ids is not None else None
+    key = (hashlib.sha1(q_emb.tobytes()).hexdigest(), generation, k, nprobe, ef_search, scope_key)
+    ids = retrieval_cache.get(key)
+    if ids is None:
+        if scope_ids is None:
+            row = query_searcher.submit((q_emb, k, nprobe, ef_search))
+            ids = [int(i) for i in row if i >= 0]
+        else:
+            ids = search_scope(q_emb, k, scope_ids, nprobe=nprobe, ef_search=ef_search,
+                               key=(scope_key, generation))
+        retrieval_cache.set(key, ids)
+    return chunk_store.lookup(ids)
+
+def build_context(query, k, options, scope_ids=None):
+    """Retrieve candidates for `query` and pack k of them into a prompt context
+    (MMR, overlap merging, token budget; see ragapp/context.py).
+    `options` comes from search_options()."""
+    items = retrieve(query, k * MMR_FETCH_FACTOR, nprobe=options["nprobe"], ef_search=options["ef_search"],
+                     scope_ids=scope_ids)
+    ids, vectors = chunk_store.vectors_for_ids([i["id"] for i in items])
+    vectors_by_id = dict(zip(ids.tolist(), vectors)) if len(ids) else {}
+    budget = options["max_context_tokens"] or CONTEXT_TOKENS
+    return pack(items, embed_query(query), vectors_by_id, k, budget)
+
+def context_report(context):
+    return {
+        "context_used": len(context.passages),
+        "context_tokens": context.tokens,
+        "tokens_saved": context.naive_tokens - context.tokens,
+    }
+
+def flatten_messages(messages):
     # Flatten messages into one prompt
     system_prompt = ""
     user_prompt = ""
@@ -76,14 +226,217 @@ def gemini_chat(messages, model="gemini-1.5-flash", max_output_tokens=500, tempe
             system_prompt += m["content"] + "\n"
         elif m["role"] == "user":
             user_prompt += m["content"] + "\n"
-
-    prompt = system_prompt + "\n" + user_prompt
-    model = genai.GenerativeModel(model)
-    response = model.generate_content(prompt, generation_config={
-        "max_output_tokens": max_output_tokens,
-        "temperature": temperature
-    })
-    return response.text
+    return system_prompt + "\n" + user_prompt
+
+def gemini_chat(messages, model="gemini-1.5-flash", max_output_tokens=500, temperature=0.3, cache=None):
+    """One completion. Identical calls are answered from llm_cache; pass
+    cache=False to always sample (cache=None decides by temperature)."""
+    prompt = flatten_messages(messages)
+    config = {"max_output_tokens": max_output_tokens, "temperature": temperature}
+    key = cache_key(model, prompt, config) if should_cache(temperature, cache) else None
+    if key:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+    started = time.monotonic()
+    text = llm.generate(prompt, model, config)
+    if key:
+        llm_cache.set(key, text, time.monotonic() - started)
+    return text
+
+def gemini_stream(messages, model="gemini-1.5-flash", max_output_tokens=500, temperature=0.3, cache=None):
+    """Like gemini_chat, but yields text pieces as the model produces them.
+    A cached answer is yielded in one piece; a streamed one is cached once complete."""
+    prompt = flatten_messages(messages)
+    config = {"max_output_tokens": max_output_tokens, "temperature": temperature}
+    key = cache_key(model, prompt, config) if should_cache(temperature, cache) else None
+    if key:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    started = time.monotonic()
+    parts = []
+    for text in llm.stream(prompt, model, config):
+        parts.append(text)
+        yield text
+    if key:
+        llm_cache.set(key, "".join(parts), time.monotonic() - started)
+
+def rate_limited_response(error):
+    response = JsonResponse({"error": f"LLM provider is rate limiting requests: {error}"}, status=503)
+    response["Retry-After"] = "30"
+    return response
+
+def wants_stream(request, data):
+    """An explicit "stream" (JSON bool/number, or a form value such as "1",
+    "true", "0", "false") wins; otherwise stream if the client accepts SSE."""
+    stream = data.get("stream")
+    if stream is None or stream == "":
+        return "text/event-stream" in request.META.get("HTTP_ACCEPT", "")
+    if isinstance(stream, str):
+        return stream.strip().lower() in ("1", "true", "yes", "on")
+    return bool(stream)
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def sse_response(context, messages, **gen_kwargs):
+    """Server-sent events: retrieved context metadata first, then model tokens."""
+    def events():
+        yield sse_event("context", {
+            **context_report(context),
+            "sources": [{"id": p["id"], "ids": p["ids"], "file": p["file"], "source": p["source"],
+                         "page_start": p["page_start"], "page_end": p["page_end"]} for p in context.passages],
+        })
+        try:
+            for text in gemini_stream(messages, **gen_kwargs):
+                yield sse_event("token", {"text": text})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        yield sse_event("done", {})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
+
+# --- BACKGROUND JOBS ---
+def _grouped(iterable, size):
+    group = []
+    for item in iterable:
+        group.append(item)
+        if len(group) == size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+def index_pdf_job(job, progress):
+    """Extract, chunk, embed and index an uploaded PDF (runs on an ingest worker).
+
+    Byte-identical re-uploads reuse the earlier upload's vectors, chunks already
+    in the index are not added again, and chunks seen before are not re-embedded.
+    Pages are streamed through the chunker in groups, so only one group of
+    chunk texts is in memory at a time.
+    """
+    path = job.payload["path"]
+    source = job.payload.get("source", "unknown")
+    file_name = job.payload["file"]
+    owner_id = job.payload.get("owner_id")
+
+    progress("hashing")
+    file_hash = file_sha256(path)
+    existing = chunk_store.find_document(file_hash)
+    if existing:
+        doc_id = chunk_store.add_document(file_hash, file_name, source, existing["chunk_ids"], owner_id)
+        return {"document_id": doc_id, "chunks": len(existing["chunk_ids"]),
+                "new_vectors": 0, "duplicate_of": existing["id"]}
+
+    n_pages = page_count(path)
+    progress("extracting", 0, n_pages)
+    chunk_ids, seen = [], set()  # this document's chunks, in order, without repeats
+    new_ids, new_vectors = [], []
+    n_chunks = embedded = 0
+    step = max(EMBED_BATCH_SIZE * 8, EMBED_POOL_MIN_CHUNKS)
+    try:
+        for group in _grouped(iter_chunks(text_cache.iter_pages(path)), step):
+            n_chunks += len(group)
+            hashes = [text_sha256(c.text) for c in group]
+
+            # chunks that are already stored map onto their existing ids
+            known = chunk_store.ids_for_hashes(hashes)
+            new = {}
+            for c, h in zip(group, hashes):
+                if h not in known and h not in new:
+                    new[h] = c
+            cached = chunk_store.cached_embeddings(new)
+            to_embed = [h for h in new if h not in cached]
+            if to_embed:
+                fresh = dict(zip(to_embed, embed_texts([new[h].text for h in to_embed])))
+                chunk_store.cache_embeddings(fresh)
+                cached.update(fresh)
+                embedded += len(to_embed)
+
+            # pending until the vectors are in the index: other uploads can't
+            # reuse these ids yet, so a rollback below never breaks them
+            ids = chunk_store.append([
+                {"text": c.text, "source": source, "file": file_name, "chunk_hash": h,
+                 "page_start": c.page_start, "page_end": c.page_end}
+                for h, c in new.items()
+            ], pending=True)
+            new_ids.extend(ids)
+            new_vectors.extend(cached[h] for h in new)
+            known.update(zip(new, ids))
+            for h in hashes:
+                if known[h] not in seen:
+                    seen.add(known[h])
+                    chunk_ids.append(known[h])
+            progress("embedding", group[-1].page_end, n_pages)
+
+        if not n_chunks:
+            raise ValueError("no text in PDF")
+
+        progress("indexing", n_pages, n_pages)
+        if new_ids:
+            with index_manager.writing() as index:
+                index.add_with_ids(np.vstack(new_vectors).astype("float32"), np.array(new_ids, dtype="int64"))
+    except Exception:
+        # don't leave stored chunks without vectors behind
+        chunk_store.remove(new_ids)
+        raise
+    chunk_store.mark_indexed(new_ids)
+
+    doc_id = chunk_store.add_document(file_hash, file_name, source, chunk_ids, owner_id)
+    return {"document_id": doc_id, "chunks": n_chunks, "new_vectors": len(new_ids),
+            "embedded": embedded, "pages": n_pages}
+
+def needs_compaction():
+    tombstones = chunk_store.tombstone_count()
+    if not tombstones:
+        return False
+    total = tombstones + chunk_store.count()
+    return tombstones >= COMPACT_MIN_TOMBSTONES or tombstones >= COMPACT_TOMBSTONE_RATIO * total
+
+def _index_bytes():
+    return os.path.getsize(INDEX_PATH) if os.path.exists(INDEX_PATH) else 0
+
+def compact_index_job(job, progress):
+    """Rebuild the index without deleted vectors and purge tombstoned chunks."""
+    if not job.payload.get("force") and not needs_compaction():
+        return {"skipped": True, "tombstones": chunk_store.tombstone_count()}
+
+    before = _index_bytes() + chunk_store.disk_bytes()
+    progress("rebuilding")
+    # inside the write lock no upload can add vectors, so every vector without
+    # a live chunk row (deleted, or left by a crashed upload) can go
+    with index_manager.writing(promote=False) as index:
+        compacted, dropped = ann.compact(index, chunk_store.live_ids())
+        index_manager.replace(compacted)
+    progress("purging")
+    purged = chunk_store.purge_deleted()
+    chunk_store.vacuum()
+    after = _index_bytes() + chunk_store.disk_bytes()
+    return {"vectors_dropped": dropped, "chunks_purged": purged,
+            "vectors": compacted.ntotal, "reclaimed_bytes": before - after}
+
+def _queued_compaction():
+    return IngestJob.objects.filter(kind="compact_index", status__in=["queued", "running"]).first()
+
+def delete_documents(owner_id=None, source=None, file=None):
+    """Delete matching documents, drop their now-unused vectors and queue a
+    compaction when enough tombstones have built up."""
+    n_docs, chunk_ids = chunk_store.delete_documents(owner_id=owner_id, source=source, file=file)
+    removed = 0
+    if chunk_ids:
+        with index_manager.writing(promote=False) as index:
+            removed = ann.remove_ids(index, chunk_ids)
+    job = None
+    if needs_compaction():
+        job = _queued_compaction() or jobs.enqueue("compact_index")
+    return {"documents_deleted": n_docs, "chunks_deleted": len(chunk_ids),
+            "vectors_removed": removed, "compaction_job_id": job.id if job else None}
 
 # --- VIEWS ---
 @csrf_exempt
@@ -99,31 +452,21 @@ def upload_pdf(request):
 
     filename = f"uploads/{timezone.now().strftime('%Y%m%d%H%M%S')}_{uploaded_file.name}"
     saved_path = default_storage.save(filename, uploaded_file)
-    full_path = os.path.join(settings.MEDIA_ROOT, filename)
-
-    text = extract_text_from_pdf(full_path)
-    if not text.strip():
-        return JsonResponse({"error": "no text in PDF"}, status=400)
-
-    chunks = chunk_text(text)
-
-    index, meta = load_or_create_index()
-    vectors, ids = [], []
-    for chunk in chunks:
-        emb = create_embedding(chunk)
-        _id = meta["next_id"]
-        meta["items"][str(_id)] = {"text": chunk, "source": source, "file": uploaded_file.name}
-        meta["next_id"] += 1
-        vectors.append(emb)
-        ids.append(_id)
-
-    if vectors:
-        arr = np.vstack(vectors).astype("float32")
-        faiss.normalize_L2(arr)
-        index.add_with_ids(arr, np.array(ids, dtype="int64"))
-
-    save_index_meta(index, meta)
-    return JsonResponse({"message": "file indexed", "chunks": len(chunks)})
+    full_path = os.path.join(settings.MEDIA_ROOT, saved_path)
+
+    # uploads made with a token are also searchable with scope "mine"
+    user = user_from_request(request)
+    job = jobs.enqueue("index_pdf", path=full_path, source=source, file=uploaded_file.name,
+                       owner_id=user.id if user else None)
+    return JsonResponse({"message": "file queued", "job_id": job.id}, status=202)
+
+def job_status(request, job_id):
+    if request.method != "GET":
+        return JsonResponse({"error": "GET only"}, status=405)
+    job = IngestJob.objects.filter(id=job_id).first()
+    if not job:
+        return JsonResponse({"error": "job not found"}, status=404)
+    return JsonResponse(job.as_dict())
 
 @csrf_exempt
 def chat(request):
@@ -134,23 +477,31 @@ def chat(request):
     question = data.get("question", "")
     if not question:
         return JsonResponse({"error": "question required"}, status=400)
+    try:
+        options = search_options(data)
+        scope_ids = resolve_scope(request, data)
+    except PermissionError as e:
+        return JsonResponse({"error": str(e)}, status=401)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-    index, meta = load_or_create_index()
-    q_emb = create_embedding(question).reshape(1, -1)
-    D, I = index.search(q_emb, 3)
-    matched = [meta["items"][str(int(idx))]["text"] for idx in I[0] if str(int(idx)) in meta["items"]]
+    context = build_context(question, 3, options, scope_ids)
 
-    context = "\n\n---\n\n".join(matched)
     system_prompt = "You are a helpful tutor. Use only the provided context to answer."
-    user_prompt = f"Context:\n{context}\n\nQuestion: {question}"
+    user_prompt = f"Context:\n{context.text}\n\nQuestion: {question}"
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    answer = gemini_chat(
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-    )
-    return JsonResponse({"answer": answer, "context_used": len(matched)})
+    if wants_stream(request, data):
+        return sse_response(context, messages, cache=data.get("cache"))
+
+    try:
+        answer = gemini_chat(messages=messages, cache=data.get("cache"))
+    except RateLimited as e:
+        return rate_limited_response(e)
+    return JsonResponse({"answer": answer, **context_report(context)})
 
 @csrf_exempt
 def generate_questions(request):
@@ -161,28 +512,98 @@ def generate_questions(request):
     prompt = data.get("prompt", "")
     count = int(data.get("count", 5))
 
-    index, meta = load_or_create_index()
-    if not meta["items"]:
+    try:
+        options = search_options(data)
+        scope_ids = resolve_scope(request, data)
+    except PermissionError as e:
+        return JsonResponse({"error": str(e)}, status=401)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if scope_ids is None:
+        first = chunk_store.first()
+    else:
+        first = next(iter(chunk_store.lookup(scope_ids[:1])), None)
+    if first is None:
         return JsonResponse({"error": "no indexed documents"}, status=400)
 
-    first_text = next(iter(meta["items"].values()))["text"]
-    q_emb = create_embedding(prompt or first_text).reshape(1, -1)
-    D, I = index.search(q_emb, 5)
-    matched = [meta["items"][str(int(idx))]["text"] for idx in I[0] if str(int(idx)) in meta["items"]]
+    context = build_context(prompt or first["text"], 5, options, scope_ids)
 
-    context = "\n\n---\n\n".join(matched)
     system_prompt = "You are an exam generator. Create exam-style questions from the context."
-    user_prompt = f"Context:\n{context}\n\nTask: Generate {count} exam-style questions."
-
-    questions = gemini_chat(
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        max_output_tokens=700,
-        temperature=0.6,
-    )
-    return JsonResponse({"questions": questions})
+    user_prompt = f"Context:\n{context.text}\n\nTask: Generate {count} exam-style questions."
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    if wants_stream(request, data):
+        return sse_response(context, messages, max_output_tokens=700, temperature=0.6, cache=data.get("cache"))
+
+    try:
+        questions = gemini_chat(
+            messages=messages,
+            max_output_tokens=700,
+            temperature=0.6,
+            cache=data.get("cache"),
+        )
+    except RateLimited as e:
+        return rate_limited_response(e)
+    return JsonResponse({"questions": questions, **context_report(context)})
+
+def index_stats(request):
+    if request.method != "GET":
+        return JsonResponse({"error": "GET only"}, status=405)
+    stats = index_manager.stats()
+    stats["chunks"] = chunk_store.count()
+    stats["tombstones"] = chunk_store.tombstone_count()
+    stats["embedding_cache"] = embedding_cache.stats()
+    stats["retrieval_cache"] = retrieval_cache.stats()
+    stats["scope_cache"] = scope_cache.stats()
+    stats["text_cache"] = {"hits": text_cache.hits, "misses": text_cache.misses}
+    stats["llm_cache"] = llm_cache.stats()
+    stats["llm_client"] = llm.stats()
+    stats["auth_cache"] = token_cache.stats()
+    stats["query_embedder"] = query_embedder.stats()
+    stats["query_searcher"] = query_searcher.stats()
+    return JsonResponse(stats)
+
+def _delete_view(request, **filters):
+    """Delete the caller's matching documents; staff may add ?all=1 to
+    delete every user's (and legacy, ownerless) matching documents."""
+    if request.method != "DELETE":
+        return JsonResponse({"error": "DELETE only"}, status=405)
+    user = user_from_request(request)
+    if user is None:
+        return JsonResponse({"error": "Unauthorized (provide Token header)"}, status=401)
+    if request.GET.get("all") == "1":
+        if not user.is_staff:
+            return JsonResponse({"error": "staff only"}, status=403)
+    else:
+        filters["owner_id"] = user.id
+    result = delete_documents(**filters)
+    if not result["documents_deleted"] and not result["chunks_deleted"]:
+        return JsonResponse({"error": "no matching documents"}, status=404)
+    return JsonResponse(result)
+
+@csrf_exempt
+def delete_by_file(request, name):
+    return _delete_view(request, file=name)
+
+@csrf_exempt
+def delete_by_source(request, source):
+    return _delete_view(request, source=source)
+
+@csrf_exempt
+def compact_index(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+    user = user_from_request(request)
+    if user is None:
+        return JsonResponse({"error": "Unauthorized (provide Token header)"}, status=401)
+    if not user.is_staff:
+        return JsonResponse({"error": "staff only"}, status=403)
+    job = _queued_compaction() or jobs.enqueue("compact_index", force=True)
+    return JsonResponse({"message": "compaction queued", "job_id": job.id}, status=202)
 
 @csrf_exempt
 def generate_flashcards(request):
@@ -197,17 +618,18 @@ def generate_flashcards(request):
             return JsonResponse({"error": "No topic provided"}, status=400)
 
         # Call Gemini model
-        model = genai.GenerativeModel("gemini-1.5-flash")
         prompt = f"Generate 5 flashcards for the topic '{topic}'. \
 Each flashcard should be JSON with 'question' and 'answer'. Return a JSON array."
 
-        response = model.generate_content(prompt)
+        # the model's default generation config, sampled fresh every time (not
+        # through gemini_chat/llm_cache, so a topic gets new cards on each call)
+        text = llm.generate(prompt, "gemini-1.5-flash", {})
 
         # Parse Gemini response
         try:
-            flashcards = json.loads(response.text)
+            flashcards = json.loads(text)
         except Exception:
-            flashcards = [{"question": "Could not parse AI output", "answer": response.text}]
+            flashcards = [{"question": "Could not parse AI output", "answer": text}]
 
         # Make sure it's always a list
         if not isinstance(flashcards, list):
@@ -215,6 +637,8 @@ Each flashcard should be JSON with 'question' and 'answer'. Return a JSON array.
 
         return JsonResponse({"flashcards": flashcards})
 
+    except RateLimited as e:
+        return rate_limited_response(e)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
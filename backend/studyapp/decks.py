@@ -0,0 +1,52 @@
+# studyapp/decks.py
+# Parsing of imported decks and bulk persistence of generated/imported items.
+import io
+import csv
+import json
+
+from django.db import transaction
+
+from .models import Flashcard, Worksheet
+
+MAX_IMPORT_ITEMS = 5000
+BULK_BATCH_SIZE = 500
+
+
+def parse_cards(data, filename=""):
+    """Cards from a deck file: a JSON array of {"question", "answer"} objects,
+    or CSV/TSV rows of question,answer (Anki's plain-text export is TSV)."""
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    if filename.lower().endswith(".json") or text.lstrip().startswith("["):
+        cards = json.loads(text)
+        if not isinstance(cards, list):
+            raise ValueError("JSON deck must be an array of cards")
+        return cards
+    delimiter = "\t" if filename.lower().endswith((".tsv", ".txt")) or "\t" in text.split("\n", 1)[0] else ","
+    cards = []
+    for row in csv.reader(io.StringIO(text), delimiter=delimiter):
+        # Anki exports start with "#separator:tab"-style header lines
+        if not row or row[0].startswith("#"):
+            continue
+        cards.append({"question": row[0], "answer": row[1] if len(row) > 1 else ""})
+    return cards
+
+
+def save_flashcards(user, content, cards):
+    """Insert cards in one transaction with batched INSERTs; returns the rows."""
+    rows = [
+        Flashcard(user=user, content=content, topic=c.get("topic") or content.title,
+                  question=str(c.get("question", "")), answer=str(c.get("answer", "")))
+        for c in cards
+    ]
+    with transaction.atomic():
+        return Flashcard.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+
+
+def save_worksheet_questions(user, content, questions):
+    rows = [
+        Worksheet(user=user, content=content, topic=content.title,
+                  question=q.get("question", "") if isinstance(q, dict) else str(q))
+        for q in questions
+    ]
+    with transaction.atomic():
+        return Worksheet.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
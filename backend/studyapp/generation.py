@@ -0,0 +1,109 @@
+# studyapp/generation.py
+# Flashcard / worksheet generation. Large uploads are split into sections
+# that are generated concurrently; each section's items are saved and
+# handed back as soon as that section finishes.
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ragapp.chunking import iter_chunks
+from ragapp.views import gemini_chat, text_cache
+
+from .decks import save_flashcards, save_worksheet_questions
+from .planner import parse_json
+
+SECTION_TOKENS = int(os.getenv("STUDY_SECTION_TOKENS", "1200"))
+GENERATION_WORKERS = int(os.getenv("STUDY_GENERATION_WORKERS", "4"))
+# count=auto asks for one item per this many words of content
+WORDS_PER_ITEM = int(os.getenv("STUDY_WORDS_PER_ITEM", "150"))
+MIN_GENERATED_ITEMS = 5
+MAX_GENERATED_ITEMS = int(os.getenv("STUDY_MAX_GENERATED_ITEMS", "200"))
+
+
+def generate_items(choice, text, n=5, label="Content snippet"):
+    """One LLM call: n flashcards ({question, answer} dicts) or n worksheet questions."""
+    if choice == "flashcards":
+        system_prompt = "You are a flashcard generator. Always respond ONLY with valid JSON."
+        user_prompt = f"""
+Create {n} concise Q&A flashcards from the following content. Return a JSON array:
+[{{"question":"Q1", "answer":"A1"}}, ...]
+{label}:
+\"\"\"{text}\"\"\"
+"""
+        max_output_tokens, temperature = max(600, 120 * n), 0.4
+    else:
+        system_prompt = "You are an exam/worksheet generator. Respond with JSON."
+        user_prompt = f"""
+Generate {n} exam-style questions (mix of MCQ/short-answer) from the content below.
+Return a JSON list of strings (questions).
+{label}:
+\"\"\"{text}\"\"\"
+"""
+        max_output_tokens, temperature = max(700, 100 * n), 0.5
+    raw = gemini_chat(
+        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+        max_output_tokens=max_output_tokens,
+        temperature=temperature,
+    )
+    return parse_json(raw)
+
+
+def save_items(user, content, choice, items):
+    """Persist generated items; returns them serialized for the response."""
+    if choice == "flashcards":
+        rows = save_flashcards(user, content, items)
+        return [{"id": fc.id, "question": fc.question, "answer": fc.answer} for fc in rows]
+    rows = save_worksheet_questions(user, content, items)
+    return [{"id": w.id, "question": w.question} for w in rows]
+
+
+def split_sections(path, max_tokens=SECTION_TOKENS):
+    return list(iter_chunks(text_cache.iter_pages(path), max_tokens, 0))
+
+
+def target_count(sections, count="auto"):
+    """Total items to generate: an explicit count, or one per WORDS_PER_ITEM words."""
+    if count in (None, "", "auto"):
+        words = sum(len(s.text.split()) for s in sections)
+        count = words // WORDS_PER_ITEM
+    else:
+        count = int(count)
+    return max(MIN_GENERATED_ITEMS, min(count, MAX_GENERATED_ITEMS))
+
+
+def allocate(sections, total):
+    """Split `total` items over sections in proportion to their length
+    (largest remainder, so longer sections get the leftovers)."""
+    sizes = [len(s.text.split()) for s in sections]
+    if not any(sizes):
+        sizes = [1] * len(sections)  # nothing to weigh by: split evenly
+    words = sum(sizes)
+    shares = [total * size / words for size in sizes]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(sections)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def iter_section_batches(user, content, choice, sections, counts, workers=GENERATION_WORKERS):
+    """Generate every section with a non-zero count concurrently and yield
+    (section_index, items, error) as each one completes. Items are saved
+    here, on the caller's thread, so the workers never touch the database."""
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = {
+            pool.submit(generate_items, choice, section.text, n, "Content section"): i
+            for i, (section, n) in enumerate(zip(sections, counts)) if n
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                items = future.result()
+                if not isinstance(items, list):
+                    raise ValueError("model did not return a JSON list")
+                yield i, save_items(user, content, choice, items), None
+            except Exception as e:
+                yield i, [], str(e)
+    finally:
+        # a client that disconnects mid-stream shouldn't keep the model busy
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,42 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from studyapp.decks import save_flashcards
+from studyapp.models import Content, Flashcard
+
+
+class Command(BaseCommand):
+    help = ("Rows/sec for saving generated flashcards one create() at a time vs bulk_create "
+            "in one transaction. Writes to the configured database and removes its rows afterwards.")
+    # no views involved; skip loading them (and the embedding model) for the URL checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=500)
+
+    def handle(self, *args, **options):
+        n = options["rows"]
+        cards = [{"question": f"Question {i}?", "answer": f"Answer {i}"} for i in range(n)]
+        user = User.objects.create_user(username=f"bench-cards-{time.time_ns()}")
+        try:
+            content = Content.objects.create(user=user, title="bench deck", choice="flashcards")
+
+            # the previous path: one INSERT and one commit per card
+            start = time.perf_counter()
+            for c in cards:
+                Flashcard.objects.create(user=user, content=content, topic=content.title,
+                                         question=c["question"], answer=c["answer"])
+            per_row = time.perf_counter() - start
+
+            start = time.perf_counter()
+            save_flashcards(user, content, cards)
+            bulk = time.perf_counter() - start
+        finally:
+            user.delete()
+
+        self.stdout.write(f"{'path':<10}{'seconds':>10}{'rows/s':>12}")
+        self.stdout.write(f"{'per-row':<10}{per_row:>10.3f}{n / per_row:>12.0f}")
+        self.stdout.write(f"{'bulk':<10}{bulk:>10.3f}{n / bulk:>12.0f}")
+        self.stdout.write(self.style.SUCCESS(f"bulk_create is {per_row / bulk:.1f}x faster for {n} rows"))
@@ -0,0 +1,98 @@
+import json
+import time
+import random
+import statistics
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+def _call(method, url, token=None, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(url, data=data, method=method)
+    request.add_header("Content-Type", "application/json")
+    if token:
+        request.add_header("Authorization", f"Token {token}")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        body, status = e.read(), e.code
+    except (urllib.error.URLError, OSError) as e:
+        body, status = str(e).encode(), 0
+    return status, body, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = ("Concurrent load on the studyapp endpoints of a running server: listing reads, "
+            "deck imports and logins. Run it against the server once per database profile "
+            "(e.g. DB_ENGINE=sqlite with SQLITE_WAL=0/1, DB_ENGINE=postgres) to compare them.")
+    # only talks HTTP; skip loading the views (and the embedding model) for the URL checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/api/study")
+        parser.add_argument("--users", type=int, default=16, help="concurrent clients, one account each")
+        parser.add_argument("--requests", type=int, default=50, help="requests per client")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="share of deck imports")
+        parser.add_argument("--login-ratio", type=float, default=0.05)
+        parser.add_argument("--cards", type=int, default=20, help="cards per imported deck")
+
+    def handle(self, *args, **options):
+        base = options["url"].rstrip("/")
+        run_id = time.time_ns()
+        accounts = []
+        for i in range(options["users"]):
+            username, password = f"load-{run_id}-{i}", "load-test-password"
+            status, body, _ = _call("POST", f"{base}/signup/", payload={"username": username, "password": password})
+            if status != 200:
+                self.stderr.write(f"signup failed ({status}): {body[:200]!r}")
+                return
+            accounts.append((username, password, json.loads(body)["token"]))
+
+        cards = [{"question": f"Question {i}?", "answer": f"Answer {i}"} for i in range(options["cards"])]
+        results = defaultdict(list)  # op -> [(status, seconds)]
+
+        def client(i):
+            username, password, token = accounts[i]
+            # same request mix on every run, so profiles are compared like for like
+            rng = random.Random(i)
+            out = []
+            for n in range(options["requests"]):
+                roll = rng.random()
+                if roll < options["login_ratio"]:
+                    op, r = "login", _call("POST", f"{base}/login/",
+                                           payload={"username": username, "password": password})
+                elif roll < options["login_ratio"] + options["write_ratio"]:
+                    op, r = "import_items", _call("POST", f"{base}/import_items/", token,
+                                                  {"title": f"deck {n}", "cards": cards})
+                else:
+                    op, r = "my_flashcards", _call("GET", f"{base}/my_flashcards/?limit=50", token)
+                out.append((op, r[0], r[2]))
+            return out
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(accounts)) as pool:
+            for out in pool.map(client, range(len(accounts))):
+                for op, status, seconds in out:
+                    results[op].append((status, seconds))
+        wall = time.perf_counter() - start
+
+        total = sum(len(r) for r in results.values())
+        failed = 0
+        self.stdout.write(f"{'endpoint':<15}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+        for op in sorted(results):
+            rows = results[op]
+            errors = sum(1 for status, _ in rows if not 200 <= status < 300)
+            failed += errors
+            ms = sorted(seconds * 1000 for _, seconds in rows)
+            p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+            self.stdout.write(f"{op:<15}{len(rows):>9}{errors:>8}{statistics.median(ms):>9.1f}{p95:>9.1f}{ms[-1]:>9.1f}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} requests from {len(accounts)} clients in {wall:.2f}s: "
+            f"{total / wall:.0f} req/s, {failed} errors"))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studyapp', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='choice',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='curriculum',
+            name='duration',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='curriculum',
+            name='study_plan',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='flashcard',
+            name='content',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='flashcards', to='studyapp.content'),
+        ),
+        migrations.AddField(
+            model_name='worksheet',
+            name='content',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='worksheets', to='studyapp.content'),
+        ),
+        migrations.AddIndex(
+            model_name='curriculum',
+            index=models.Index(fields=['user', 'created_at'], name='curriculum_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcard',
+            index=models.Index(fields=['user', 'created_at'], name='flashcard_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='worksheet',
+            index=models.Index(fields=['user', 'created_at'], name='worksheet_user_created'),
+        ),
+    ]
@@ -7,8 +7,13 @@ class Curriculum(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="curriculums")
     title = models.CharField(max_length=255)
     file = models.FileField(upload_to="curriculums/", null=True, blank=True)  # allow empty initially
+    duration = models.CharField(max_length=100, blank=True, default="")
+    study_plan = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "created_at"], name="curriculum_user_created")]
+
     def __str__(self):
         return f"{self.title} ({self.user.username})"
 
@@ -17,6 +22,7 @@ class Content(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="contents")
     title = models.CharField(max_length=255)
     file = models.FileField(upload_to="contents/", null=True, blank=True)
+    choice = models.CharField(max_length=20, blank=True, default="")  # flashcards | worksheet
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -25,21 +31,29 @@ class Content(models.Model):
 
 class Flashcard(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="flashcards")
+    content = models.ForeignKey(Content, on_delete=models.CASCADE, related_name="flashcards", null=True, blank=True)
     topic = models.CharField(max_length=255)
     question = models.TextField()
     answer = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "created_at"], name="flashcard_user_created")]
+
     def __str__(self):
         return f"Flashcard: {self.topic} - {self.question[:30]}"
 
 
 class Worksheet(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="worksheets")
+    content = models.ForeignKey(Content, on_delete=models.CASCADE, related_name="worksheets", null=True, blank=True)
     topic = models.CharField(max_length=255)
     question = models.TextField()
     answer = models.TextField(null=True, blank=True)  # let user fill later
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "created_at"], name="worksheet_user_created")]
+
     def __str__(self):
         return f"Worksheet: {self.topic} - {self.question[:30]}"
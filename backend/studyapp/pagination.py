@@ -0,0 +1,62 @@
+# studyapp/pagination.py
+# Keyset ("cursor") pagination over (created_at, id), newest first, and
+# ETag / If-None-Match handling for the listing endpoints.
+import json
+import base64
+import hashlib
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, _id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+
+
+def paginate(request, queryset):
+    """Return (rows, next_cursor) for the page after ?cursor=, at most ?limit= rows.
+
+    Walks the (user, created_at) index instead of OFFSET, so later pages cost
+    the same as the first one and rows added meanwhile don't shift pages.
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    queryset = queryset.order_by("-created_at", "-id")
+    cursor = request.GET.get("cursor")
+    if cursor:
+        created_at, _id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=_id))
+    rows = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def etag_response(request, payload):
+    """JSON response with an ETag of its body; 304 if the client already has it."""
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    client_etags = [t.strip() for t in request.META.get("HTTP_IF_NONE_MATCH", "").split(",")]
+    if etag in client_etags or "*" in client_etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # per-user data: let clients revalidate, but keep shared caches out
+    response["Cache-Control"] = "private, no-cache"
+    return response
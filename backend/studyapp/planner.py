@@ -0,0 +1,139 @@
+# studyapp/planner.py
+# Study plans over the whole curriculum: topics are extracted from every
+# chunk in parallel (map), merged locally (reduce) and turned into a plan by
+# one final LLM call. Plans are cached per (curriculum file, duration).
+import os
+import re
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ragapp.chunking import iter_chunks
+from ragapp.llm_cache import cache_key, should_cache
+from ragapp.views import gemini_chat, llm_cache, text_cache
+
+PLAN_CHUNK_TOKENS = int(os.getenv("STUDY_PLAN_CHUNK_TOKENS", "1500"))
+# concurrent topic-extraction calls per plan (the shared LLM client also
+# caps concurrency and tokens per minute across the process)
+PLAN_MAP_WORKERS = int(os.getenv("STUDY_PLAN_MAP_WORKERS", "4"))
+# topics passed to the planning call; the most frequent ones win beyond this
+PLAN_MAX_TOPICS = int(os.getenv("STUDY_PLAN_MAX_TOPICS", "60"))
+PLAN_TEMPERATURE = 0.3
+# bump when the prompts change so cached plans are rebuilt
+PLAN_VERSION = 1
+
+_NUMBERING = re.compile(r"^(?:\d+(?:\.\d+)*[.)]?|[-*•])\s+")
+
+SYSTEM_PROMPT = "You are a study planner. Always respond with valid JSON."
+
+
+def parse_json(raw):
+    try:
+        return json.loads(raw)
+    except Exception:
+        cleaned = raw.strip().replace("```json", "").replace("```", "")
+        return json.loads(cleaned)
+
+
+def extract_topics(text):
+    """Map step: the topics one curriculum chunk covers."""
+    raw = gemini_chat(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"""
+List the study topics covered by this part of a curriculum, in the order they appear.
+Return ONLY a JSON array of short topic names (at most 12), e.g. ["Topic1", "Topic2"].
+Curriculum PART:
+\"\"\"{text}\"\"\"
+            """},
+        ],
+        max_output_tokens=256,
+        temperature=0.2,
+    )
+    try:
+        topics = parse_json(raw)
+    except ValueError:
+        return []
+    if isinstance(topics, dict):
+        topics = topics.get("topics", [])
+    return [str(t) for t in topics if str(t).strip()] if isinstance(topics, list) else []
+
+
+def _normalize(topic):
+    topic = _NUMBERING.sub("", " ".join(topic.split())).strip(" .:;,-")
+    return topic, topic.casefold()
+
+
+def merge_topics(topic_lists, limit=PLAN_MAX_TOPICS):
+    """Reduce step: de-duplicate case/numbering variants, keep curriculum order
+    (first appearance) and, past `limit`, the topics mentioned most often."""
+    merged = {}  # normalized -> [display name, first position, mentions]
+    for topics in topic_lists:
+        for topic in topics:
+            name, key = _normalize(topic)
+            if not key:
+                continue
+            if key in merged:
+                merged[key][2] += 1
+            else:
+                merged[key] = [name, len(merged), 1]
+    entries = list(merged.values())
+    if len(entries) > limit:
+        entries = sorted(entries, key=lambda e: (-e[2], e[1]))[:limit]
+        entries.sort(key=lambda e: e[1])
+    return [e[0] for e in entries]
+
+
+def plan_from_topics(topics, duration):
+    numbered = "\n".join(f"{i}. {t}" for i, t in enumerate(topics, 1))
+    raw = gemini_chat(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"""
+Create a study plan for the curriculum whose topics are listed below, in curriculum order. Duration: {duration}.
+Cover every topic and create a daily (or weekly) study schedule.
+Return ONLY valid JSON in this format:
+{{
+  "topics": ["Topic1", "Topic2", ...],
+  "plan": "A readable plan string or an object with day->topics mapping"
+}}
+Curriculum TOPICS:
+{numbered}
+            """},
+        ],
+        max_output_tokens=1500,
+        temperature=PLAN_TEMPERATURE,
+    )
+    try:
+        return parse_json(raw)
+    except ValueError:
+        raise RuntimeError("the model did not return a valid JSON study plan")
+
+
+def build_study_plan(path, duration, cache=None):
+    """Return (study_plan, cached) for the curriculum PDF at `path`.
+
+    Pass cache=False to rebuild; topic extraction calls are cached by the
+    LLM cache on their own, so a new duration only pays for the final call.
+    """
+    key = cache_key("study_plan", text_cache.file_hash(path),
+                    {"duration": " ".join(duration.lower().split()), "version": PLAN_VERSION})
+    use_cache = should_cache(PLAN_TEMPERATURE, cache)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return json.loads(cached), True
+
+    started = time.monotonic()
+    chunks = [c.text for c in iter_chunks(text_cache.iter_pages(path), PLAN_CHUNK_TOKENS, 0)]
+    if not chunks:
+        raise ValueError("no text could be extracted from the curriculum")
+    with ThreadPoolExecutor(max_workers=max(1, min(PLAN_MAP_WORKERS, len(chunks)))) as pool:
+        topic_lists = list(pool.map(extract_topics, chunks))
+    topics = merge_topics(topic_lists)
+    if not topics:
+        raise ValueError("no topics could be extracted from the curriculum")
+    study_plan = plan_from_topics(topics, duration)
+    if use_cache:
+        llm_cache.set(key, json.dumps(study_plan), time.monotonic() - started)
+    return study_plan, False
@@ -1,3 +1,245 @@
+import os
+import json
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from ragapp.auth import token_cache
+from ragapp.chunking import Chunk
+from ragapp.llm_cache import LLMCache
+
+from . import generation, planner
+from .decks import save_flashcards
+from .models import Content, Flashcard, Worksheet
+
+
+class StudyTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="secret")
+        self.token = Token.objects.create(user=self.user).key
+
+    def auth(self, token=None):
+        return {"HTTP_AUTHORIZATION": "Token " + (token or self.token)}
+
+    def post_json(self, url, payload, **extra):
+        return self.client.post(url, json.dumps(payload), content_type="application/json", **extra)
+
+
+class ImportItemsTests(StudyTestCase):
+    url = "/api/study/import_items/"
+
+    def test_json_deck(self):
+        cards = [{"question": f"q{i}", "answer": f"a{i}"} for i in range(30)]
+        response = self.post_json(self.url, {"title": "deck", "cards": cards}, **self.auth())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["imported"], 30)
+        self.assertEqual(Flashcard.objects.filter(user=self.user, topic="deck").count(), 30)
+
+    def test_tsv_deck_skips_header_lines(self):
+        deck = "#separator:tab\n#html:false\nfront 1\tback 1\nfront 2\tback 2\n"
+        response = self.client.post(self.url, {"file": SimpleUploadedFile("anki.txt", deck.encode())},
+                                    **self.auth())
+        self.assertEqual(response.json()["imported"], 2)
+        self.assertEqual(Flashcard.objects.get(question="front 2").answer, "back 2")
+
+    def test_rejects_malformed_bodies(self):
+        for payload in ([{"question": "q", "answer": "a"}],
+                        {"cards": "abc", "kind": "worksheet"},
+                        {"cards": ["not an object"]},
+                        {"cards": []}):
+            with self.subTest(payload=payload):
+                response = self.post_json(self.url, payload, **self.auth())
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Worksheet.objects.count() + Flashcard.objects.count(), 0)
+
+    def test_requires_token(self):
+        self.assertEqual(self.post_json(self.url, {"cards": []}).status_code, 401)
+
+    def test_rejects_long_titles(self):
+        response = self.post_json(self.url, {"title": "t" * 256, "cards": [{"question": "q", "answer": "a"}]},
+                                  **self.auth())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Content.objects.count(), 0)
+
+    def test_failed_insert_leaves_no_empty_deck(self):
+        cards = [{"question": "q", "answer": "a"}]
+        with mock.patch("studyapp.views.save_flashcards", side_effect=DatabaseError("disk full")):
+            with self.assertRaises(DatabaseError):
+                self.post_json(self.url, {"title": "deck", "cards": cards}, **self.auth())
+        self.assertEqual(Content.objects.count(), 0)
+
+
+class PaginationTests(StudyTestCase):
+    url = "/api/study/my_flashcards/"
+
+    def setUp(self):
+        super().setUp()
+        content = Content.objects.create(user=self.user, title="deck", choice="flashcards")
+        save_flashcards(self.user, content, [{"question": f"q{i}", "answer": "a"} for i in range(25)])
+        # identical timestamps: the id tie-break must still give stable pages
+        Flashcard.objects.update(created_at=timezone.now())
+        other = User.objects.create_user("bob", password="x")
+        Flashcard.objects.create(user=other, topic="t", question="not mine", answer="a")
+
+    def walk(self, limit):
+        seen, cursor = [], None
+        while True:
+            url = f"{self.url}?limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+            page = self.client.get(url, **self.auth()).json()
+            seen.append([c["id"] for c in page["flashcards"]])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return seen
+
+    def test_cursor_pages_cover_every_row_once_newest_first(self):
+        pages = self.walk(10)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        ids = [i for p in pages for i in p]
+        mine = list(Flashcard.objects.filter(user=self.user).order_by("-id").values_list("id", flat=True))
+        self.assertEqual(ids, mine)
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        first = self.client.get(f"{self.url}?limit=10", **self.auth()).json()
+        Flashcard.objects.create(user=self.user, topic="t", question="newer", answer="a")
+        second = self.client.get(f"{self.url}?limit=10&cursor={first['next_cursor']}", **self.auth()).json()
+        self.assertEqual(second["flashcards"][0]["id"], first["flashcards"][-1]["id"] - 1)
+
+    def test_bad_limit_or_cursor(self):
+        self.assertEqual(self.client.get(f"{self.url}?limit=x", **self.auth()).status_code, 400)
+        self.assertEqual(self.client.get(f"{self.url}?cursor=nope", **self.auth()).status_code, 400)
+
+    def test_etag_revalidation(self):
+        response = self.client.get(self.url, **self.auth())
+        etag = response["ETag"]
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, **self.auth())
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], etag)
+        Flashcard.objects.create(user=self.user, topic="t", question="changed", answer="a")
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, **self.auth())
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+
+class TokenCacheTests(StudyTestCase):
+    url = "/api/study/my_flashcards/"
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+
+    def test_warm_requests_skip_the_token_query(self):
+        self.client.get(self.url, **self.auth())
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url, **self.auth()).status_code, 200)
+
+    def test_logout_evicts_the_token(self):
+        self.assertEqual(self.client.get(self.url, **self.auth()).status_code, 200)
+        self.assertEqual(self.client.post("/api/study/logout/", **self.auth()).status_code, 200)
+        self.assertEqual(self.client.get(self.url, **self.auth()).status_code, 401)
+
+    def test_password_change_rotates_the_token(self):
+        self.assertEqual(self.client.get(self.url, **self.auth()).status_code, 200)
+        response = self.post_json("/api/study/change_password/",
+                                  {"old_password": "secret", "new_password": "new-secret"}, **self.auth())
+        new_token = response.json()["token"]
+        self.assertEqual(self.client.get(self.url, **self.auth()).status_code, 401)
+        self.assertEqual(self.client.get(self.url, **self.auth(new_token)).status_code, 200)
+
+    def test_deactivated_user_is_evicted(self):
+        self.client.get(self.url, **self.auth())
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url, **self.auth()).status_code, 401)
+
+
+def section(n_words, page=1):
+    return Chunk(" ".join(["word"] * n_words), page, page)
+
+
+class GenerationTests(StudyTestCase):
+    def test_allocation_is_proportional_and_sums_to_the_total(self):
+        sections = [section(n) for n in (500, 300, 150, 50, 1)]
+        for total in (1, 5, 7, 13, 100, 201):
+            with self.subTest(total=total):
+                counts = generation.allocate(sections, total)
+                self.assertEqual(sum(counts), total)
+                self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertEqual(generation.allocate(sections, 100), [50, 30, 15, 5, 0])
+        self.assertEqual(generation.allocate([section(0), section(0)], 3), [2, 1])
+
+    def test_target_count_is_clamped(self):
+        sections = [section(generation.WORDS_PER_ITEM * 10)]
+        self.assertEqual(generation.target_count(sections, "auto"), 10)
+        self.assertEqual(generation.target_count([section(10)], "auto"), generation.MIN_GENERATED_ITEMS)
+        self.assertEqual(generation.target_count(sections, "2"), generation.MIN_GENERATED_ITEMS)
+        self.assertEqual(generation.target_count(sections, 10 ** 6), generation.MAX_GENERATED_ITEMS)
+
+    def test_a_failed_section_does_not_stop_the_others(self):
+        content = Content.objects.create(user=self.user, title="deck", choice="flashcards")
+        sections = [section(10, page=p) for p in (1, 2, 3, 4)]
+
+        def generate_items(choice, text, n, label):
+            calls.append(n)
+            if n == 2:
+                raise ValueError("model timed out")
+            if n == 3:
+                return {"not": "a list"}
+            return [{"question": f"q{i}", "answer": "a"} for i in range(n)]
+
+        calls = []
+        with mock.patch.object(generation, "generate_items", side_effect=generate_items):
+            results = {i: (items, error) for i, items, error in generation.iter_section_batches(
+                self.user, content, "flashcards", sections, [1, 2, 3, 0], workers=2)}
+        self.assertEqual(sorted(calls), [1, 2, 3])  # zero-count sections are skipped
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual((len(results[0][0]), results[0][1]), (1, None))
+        self.assertEqual(results[1], ([], "model timed out"))
+        self.assertEqual(results[2][0], [])
+        self.assertIn("JSON list", results[2][1])
+        self.assertEqual(Flashcard.objects.filter(content=content).count(), 1)
+
+
+class PlannerTests(StudyTestCase):
+    def test_merge_topics_normalizes_and_keeps_first_appearance(self):
+        merged = planner.merge_topics([
+            ["1. Linear  Algebra", "Vectors", "2.1) Matrices"],
+            ["linear algebra.", "- Eigenvalues", "MATRICES", ""],
+            ["* vectors", "Probability"],
+        ])
+        self.assertEqual(merged, ["Linear Algebra", "Vectors", "Matrices", "Eigenvalues", "Probability"])
+
+    def test_limit_keeps_the_most_mentioned_in_curriculum_order(self):
+        lists = [["Intro", "Sets", "Logic", "Graphs"], ["Logic", "Graphs"], ["Graphs", "Sets"]]
+        self.assertEqual(planner.merge_topics(lists, limit=3), ["Sets", "Logic", "Graphs"])
+        self.assertEqual(planner.merge_topics(lists, limit=10), ["Intro", "Sets", "Logic", "Graphs"])
+
+    def test_repeat_calls_hit_the_plan_cache(self):
+        def gemini_chat(messages, max_output_tokens, temperature):
+            prompt = messages[-1]["content"]
+            if "Curriculum PART" in prompt:
+                return json.dumps(["Topic A", "Topic B"])
+            return json.dumps({"topics": ["Topic A", "Topic B"], "plan": "day 1: A, day 2: B"})
 
-# Create your tests here.
+        text_cache = mock.Mock(file_hash=mock.Mock(return_value="pdf-hash"),
+                               iter_pages=lambda path: iter([(1, "Some curriculum text. " * 20)]))
+        cache = LLMCache(os.path.join(tempfile.mkdtemp(), "llm.sqlite3"))
+        with mock.patch.object(planner, "text_cache", text_cache), \
+                mock.patch.object(planner, "llm_cache", cache), \
+                mock.patch("ragapp.llm_cache.LLM_CACHE_ENABLED", True), \
+                mock.patch.object(planner, "gemini_chat", side_effect=gemini_chat) as chat:
+            plan, cached = planner.build_study_plan("c.pdf", "2 weeks")
+            self.assertFalse(cached)
+            calls = chat.call_count
+            again, cached = planner.build_study_plan("c.pdf", "  2   Weeks ")
+            self.assertTrue(cached)
+            self.assertEqual(again, plan)
+            self.assertEqual(chat.call_count, calls)
+            _, cached = planner.build_study_plan("c.pdf", "2 weeks", cache=False)
+            self.assertFalse(cached)
+            self.assertGreater(chat.call_count, calls)
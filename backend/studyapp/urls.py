@@ -4,13 +4,17 @@ from . import views
 urlpatterns = [
     path("signup/", views.signup),
     path("login/", views.login),
+    path("logout/", views.logout),
+    path("change_password/", views.change_password),
 
     path("upload_curriculum/", views.upload_curriculum),
     path("generate_study_plan/", views.generate_study_plan),
 
     path("upload_content_and_generate/", views.upload_content_and_generate),
+    path("import_items/", views.import_items),
 
     path("my_flashcards/", views.my_flashcards),
     path("my_worksheets/", views.my_worksheets),
     path("my_studyplans/", views.my_studyplans),
+    path("my_studyplans/<int:doc_id>/", views.my_studyplan),
 ]
@@ -2,7 +2,8 @@
 import os
 import json
 from django.conf import settings
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.models import User
 from django.core.files.storage import default_storage
@@ -11,25 +12,18 @@ from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
 from .models import Curriculum, Content, Flashcard, Worksheet
+from .pagination import etag_response, paginate
+from .decks import MAX_IMPORT_ITEMS, parse_cards, save_flashcards, save_worksheet_questions
+from .planner import build_study_plan
+from .generation import (MAX_GENERATED_ITEMS, allocate, generate_items, iter_section_batches,
+                         save_items, split_sections, target_count)
 
-# Import your RAG helpers from ragapp (gemini_chat, extract_text_from_pdf)
+# Import your RAG helpers from ragapp (extract_text_from_pdf, SSE helpers)
 # Adjust the import path if your rag app name is different.
-from ragapp.views import gemini_chat, extract_text_from_pdf
-
-# helper: get user from Authorization header "Token <token>"
-def get_user_from_request(request):
-    auth = request.META.get("HTTP_AUTHORIZATION")
-    if not auth:
-        return None
-    parts = auth.split()
-    if len(parts) != 2 or parts[0].lower() != "token":
-        return None
-    token_key = parts[1]
-    try:
-        token = Token.objects.get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
-        return None
+from ragapp.views import extract_text_from_pdf, rate_limited_response, sse_event, wants_stream
+from ragapp.llm_client import RateLimited
+from ragapp import jobs
+from ragapp.auth import user_from_request as get_user_from_request
 
 # -------- Auth endpoints --------
 @csrf_exempt
@@ -68,13 +62,49 @@ def login(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@csrf_exempt
+def logout(request):
+    """Delete the caller's token; it stops working at once (the cached entry is evicted)."""
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+    user = get_user_from_request(request)
+    if not user:
+        return JsonResponse({"error": "Unauthorized (provide Token header)"}, status=401)
+    Token.objects.filter(user=user).delete()
+    return JsonResponse({"message": "logged out"})
+
+@csrf_exempt
+def change_password(request):
+    """Set a new password and rotate the token; returns the new token."""
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+    user = get_user_from_request(request)
+    if not user:
+        return JsonResponse({"error": "Unauthorized (provide Token header)"}, status=401)
+    try:
+        data = json.loads(request.body)
+        old_password = data.get("old_password")
+        new_password = data.get("new_password")
+        if not old_password or not new_password:
+            return JsonResponse({"error": "old_password and new_password required"}, status=400)
+        if not user.check_password(old_password):
+            return JsonResponse({"error": "invalid credentials"}, status=400)
+        user.set_password(new_password)
+        user.save(update_fields=["password"])
+        Token.objects.filter(user=user).delete()
+        token = Token.objects.create(user=user)
+        return JsonResponse({"message": "password changed", "token": token.key, "username": user.username})
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
 # -------- Upload curriculum --------
 @csrf_exempt
 def upload_curriculum(request):
     """
     Accepts: multipart/form-data with "file" and optionally "duration".
     Requires Authorization header: Token <token>
-    Saves Curriculum model, extracts text, and returns doc_id.
+    Saves Curriculum model, queues text extraction, and returns doc_id + job_id
+    (poll /api/jobs/<job_id>/ for progress).
     """
     if request.method != "POST":
         return JsonResponse({"error": "POST only"}, status=405)
@@ -97,22 +127,25 @@ def upload_curriculum(request):
         duration=duration or ""
     )
 
-    # Save file path (Django will handle saving), then extract text using rag helper
-    file_path = cur.file.path  # full path
-    try:
-        text = extract_text_from_pdf(file_path)
-    except Exception as e:
-        text = ""
-        # don't fail; still return doc id
-    return JsonResponse({"message": "curriculum uploaded", "doc_id": cur.id})
+    # Extract text off the request path (Django has already saved the file)
+    job = jobs.enqueue("extract_curriculum", doc_id=cur.id)
+    return JsonResponse({"message": "curriculum uploaded", "doc_id": cur.id, "job_id": job.id})
 
-# -------- Generate study plan (uses gemini_chat) --------
+def extract_curriculum_job(job, progress):
+    """Background handler for upload_curriculum: extract the curriculum text."""
+    cur = Curriculum.objects.get(id=job.payload["doc_id"])
+    progress("extracting")
+    text = extract_text_from_pdf(cur.file.path)
+    return {"doc_id": cur.id, "chars": len(text)}
+
+# -------- Generate study plan (map-reduce over the curriculum) --------
 @csrf_exempt
 def generate_study_plan(request):
     """
-    Expects JSON: {"doc_id": <id>, "duration": "<14 days or 2 weeks>"}
+    Expects JSON: {"doc_id": <id>, "duration": "<14 days or 2 weeks>", "cache": optional bool}
     Requires Authorization header.
-    Saves the generated study_plan JSON into Curriculum.study_plan and returns it.
+    Plans from the whole curriculum (see planner.build_study_plan), saves the
+    generated study_plan JSON into Curriculum.study_plan and returns it.
     """
     if request.method != "POST":
         return JsonResponse({"error": "POST only"}, status=405)
@@ -130,48 +163,19 @@ def generate_study_plan(request):
         if not cur:
             return JsonResponse({"error": "curriculum not found for user"}, status=404)
 
-        # Extract text from saved file (use rag helper)
-        text = ""
-        try:
-            text = extract_text_from_pdf(cur.file.path)
-        except Exception:
-            text = ""
-
-        system_prompt = "You are a study planner. Always respond with valid JSON."
-        user_prompt = f"""
-Create a study plan using the curriculum below. Duration: {duration}.
-Use the curriculum text to extract the important topics and create a daily (or weekly) study schedule.
-Return ONLY valid JSON in this format:
-{{
-  "topics": ["Topic1", "Topic2", ...],
-  "plan": "A readable plan string or an object with day->topics mapping"
-}}
-Curriculum TEXT:
-\"\"\"{text[:2000]}\"\"\"   # (we keep a snippet in prompt to avoid extremely long prompt)
-        """
-
-        plan_raw = gemini_chat(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            max_output_tokens=800,
-            temperature=0.3,
-        )
-
-        # clean and parse
         try:
-            study_plan = json.loads(plan_raw)
-        except Exception:
-            cleaned = plan_raw.strip().replace("```json", "").replace("```", "")
-            study_plan = json.loads(cleaned)
+            study_plan, cached = build_study_plan(cur.file.path, duration, cache=data.get("cache"))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        except RateLimited as e:
+            return rate_limited_response(e)
 
         # Save into Curriculum
         cur.duration = duration
         cur.study_plan = study_plan
         cur.save()
 
-        return JsonResponse({"doc_id": cur.id, "study_plan": study_plan})
+        return JsonResponse({"doc_id": cur.id, "study_plan": study_plan, "cached": cached})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -179,7 +183,8 @@ Curriculum TEXT:
 @csrf_exempt
 def upload_content_and_generate(request):
     """
-    Accepts multipart/form-data with "file" and "choice" (flashcards|worksheet).
+    Accepts multipart/form-data with "file" and "choice" (flashcards|worksheet),
+    optionally "mode"=sections with "count" and "stream" (see generate_by_section).
     Requires Authorization header.
     Saves Content model then calls generator and saves Flashcards/Worksheets in DB.
     """
@@ -196,6 +201,12 @@ def upload_content_and_generate(request):
     if not uploaded_file or choice not in ("flashcards", "worksheet"):
         return JsonResponse({"error": "file and valid choice required"}, status=400)
 
+    sectioned = request.POST.get("mode") == "sections"
+    if sectioned:
+        count = request.POST.get("count", "auto")
+        if count != "auto" and not (count.isdigit() and 0 < int(count) <= MAX_GENERATED_ITEMS):
+            return JsonResponse({"error": f"count must be 'auto' or 1..{MAX_GENERATED_ITEMS}"}, status=400)
+
     # Save content model
     cont = Content.objects.create(
         user=user,
@@ -203,6 +214,10 @@ def upload_content_and_generate(request):
         file=uploaded_file,
         choice=choice
     )
+    key = "flashcards" if choice == "flashcards" else "questions"
+
+    if sectioned:
+        return generate_by_section(request, user, cont, choice, key, count)
 
     # Extract text
     try:
@@ -210,62 +225,118 @@ def upload_content_and_generate(request):
     except Exception:
         text = ""
 
-    if choice == "flashcards":
-        # Ask Gemini to produce JSON array of {question,answer}
-        system_prompt = "You are a flashcard generator. Always respond ONLY with valid JSON."
-        user_prompt = f"""
-Create 5 concise Q&A flashcards from the following content. Return a JSON array:
-[{{"question":"Q1", "answer":"A1"}}, ...]
-Content snippet:
-\"\"\"{text[:2000]}\"\"\" 
-"""
-        raw = gemini_chat(
-            messages=[{"role":"system","content":system_prompt},{"role":"user","content":user_prompt}],
-            max_output_tokens=600,
-            temperature=0.4
-        )
-        try:
-            flashcards = json.loads(raw)
-        except Exception:
-            cleaned = raw.strip().replace("```json","").replace("```","")
-            flashcards = json.loads(cleaned)
-
-        created = []
-        for f in flashcards:
-            q = f.get("question","")
-            a = f.get("answer","")
-            fc = Flashcard.objects.create(content=cont, question=q, answer=a)
-            created.append({"id": fc.id, "question": q, "answer": a})
-
-        return JsonResponse({"content_id": cont.id, "flashcards": created})
-
-    else:  # worksheet
-        system_prompt = "You are an exam/worksheet generator. Respond with JSON."
-        user_prompt = f"""
-Generate {5} exam-style questions (mix of MCQ/short-answer) from the content below.
-Return a JSON list of strings (questions).
-Content snippet:
-\"\"\"{text[:2000]}\"\"\" 
-"""
-        raw = gemini_chat(
-            messages=[{"role":"system","content":system_prompt},{"role":"user","content":user_prompt}],
-            max_output_tokens=700,
-            temperature=0.5
-        )
-        try:
-            questions = json.loads(raw)
-        except Exception:
-            cleaned = raw.strip().replace("```json","").replace("```","")
-            questions = json.loads(cleaned)
+    items = generate_items(choice, text[:2000])
+    created = save_items(user, cont, choice, items)
+    return JsonResponse({"content_id": cont.id, key: created})
 
-        created = []
-        for q in questions:
-            w = Worksheet.objects.create(content=cont, question=q)
-            created.append({"id": w.id, "question": q})
+def generate_by_section(request, user, cont, choice, key, count):
+    """mode=sections: split the whole upload into sections and generate them
+    concurrently, `count` items in total (or "auto": scaled to the length).
+    With stream=1 (or Accept: text/event-stream) every section's saved batch
+    is sent as a server-sent event as soon as it is done."""
+    try:
+        sections = split_sections(cont.file.path)
+    except Exception:
+        sections = []
+    if not sections:
+        return JsonResponse({"error": "no text could be extracted from the file"}, status=400)
+    target = target_count(sections, count)
+    counts = allocate(sections, target)
+    batches = iter_section_batches(user, cont, choice, sections, counts)
+
+    def section_info(i):
+        return {"section": i, "page_start": sections[i].page_start, "page_end": sections[i].page_end}
+
+    if not wants_stream(request, request.POST):
+        created, errors = [], []
+        for i, items, error in batches:
+            created.extend(items)
+            if error:
+                errors.append({**section_info(i), "error": error})
+        return JsonResponse({"content_id": cont.id, "sections": len(sections), "target": target,
+                             key: created, "errors": errors})
+
+    def events():
+        yield sse_event("content", {"content_id": cont.id, "sections": len(sections), "target": target})
+        total = 0
+        for i, items, error in batches:
+            if error:
+                yield sse_event("error", {**section_info(i), "error": error})
+                continue
+            total += len(items)
+            yield sse_event("batch", {**section_info(i), key: items})
+        yield sse_event("done", {"content_id": cont.id, "created": total})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+# -------- Bulk import (e.g. a deck file) --------
+@csrf_exempt
+def import_items(request):
+    """
+    Accepts multipart/form-data with a deck "file" (JSON array, CSV or TSV of
+    question,answer), or JSON {"title": ..., "cards": [{"question","answer"}, ...]}.
+    Optional "kind": flashcards (default) | worksheet.
+    Requires Authorization header. All items are written in one transaction.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
 
-        return JsonResponse({"content_id": cont.id, "questions": created})
+    user = get_user_from_request(request)
+    if not user:
+        return JsonResponse({"error": "Unauthorized (provide Token header)"}, status=401)
+
+    try:
+        uploaded_file = request.FILES.get("file")
+        if uploaded_file:
+            kind = request.POST.get("kind", "flashcards")
+            title = request.POST.get("title") or uploaded_file.name
+            items = parse_cards(uploaded_file.read(), uploaded_file.name)
+        else:
+            data = json.loads(request.body)
+            if not isinstance(data, dict):
+                return JsonResponse({"error": "expected a JSON object with \"cards\""}, status=400)
+            kind = data.get("kind", "flashcards")
+            title = data.get("title") or "Imported deck"
+            items = data.get("cards") or []
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({"error": f"could not read deck: {e}"}, status=400)
+
+    if kind not in ("flashcards", "worksheet"):
+        return JsonResponse({"error": "kind must be flashcards or worksheet"}, status=400)
+    if not isinstance(items, list):
+        return JsonResponse({"error": "cards must be a list"}, status=400)
+    if not items:
+        return JsonResponse({"error": "no cards to import"}, status=400)
+    if kind == "flashcards" and not all(isinstance(i, dict) for i in items):
+        return JsonResponse({"error": "cards must be objects with question and answer"}, status=400)
+    if len(items) > MAX_IMPORT_ITEMS:
+        return JsonResponse({"error": f"at most {MAX_IMPORT_ITEMS} items per import"}, status=400)
+    max_title = Content._meta.get_field("title").max_length
+    if not isinstance(title, str) or len(title) > max_title:
+        return JsonResponse({"error": f"title must be a string of at most {max_title} characters"}, status=400)
+
+    # the deck and its items together: a failed insert leaves no empty deck
+    with transaction.atomic():
+        cont = Content.objects.create(user=user, title=title, choice=kind)
+        if kind == "flashcards":
+            rows = save_flashcards(user, cont, items)
+        else:
+            rows = save_worksheet_questions(user, cont, items)
+    return JsonResponse({"content_id": cont.id, "imported": len(rows)}, status=201)
 
 # -------- Get user's flashcards / worksheets / studyplans --------
+# Paginated with ?cursor=<next_cursor>&limit=<n>; responses carry an ETag so
+# clients can revalidate with If-None-Match and get a 304 when nothing changed.
+def _page(request, queryset, key, serialize):
+    try:
+        rows, next_cursor = paginate(request, queryset)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return etag_response(request, {key: [serialize(r) for r in rows], "next_cursor": next_cursor})
+
 @csrf_exempt
 def my_flashcards(request):
     if request.method != "GET":
@@ -273,17 +344,17 @@ def my_flashcards(request):
     user = get_user_from_request(request)
     if not user:
         return JsonResponse({"error":"Unauthorized"}, status=401)
-    out = []
-    for fc in Flashcard.objects.filter(content__user=user).order_by("-created_at"):
-        out.append({
-            "id": fc.id,
-            "content_id": fc.content.id,
-            "title": fc.content.title,
-            "question": fc.question,
-            "answer": fc.answer,
-            "created_at": fc.created_at.isoformat()
-        })
-    return JsonResponse({"flashcards": out})
+    cards = (Flashcard.objects.filter(user=user)
+             .select_related("content")
+             .only("id", "question", "answer", "created_at", "content__id", "content__title"))
+    return _page(request, cards, "flashcards", lambda fc: {
+        "id": fc.id,
+        "content_id": fc.content_id,
+        "title": fc.content.title if fc.content else "",
+        "question": fc.question,
+        "answer": fc.answer,
+        "created_at": fc.created_at.isoformat()
+    })
 
 @csrf_exempt
 def my_worksheets(request):
@@ -292,31 +363,58 @@ def my_worksheets(request):
     user = get_user_from_request(request)
     if not user:
         return JsonResponse({"error":"Unauthorized"}, status=401)
-    out = []
-    for w in Worksheet.objects.filter(content__user=user).order_by("-created_at"):
-        out.append({
-            "id": w.id,
-            "content_id": w.content.id,
-            "title": w.content.title,
-            "question": w.question,
-            "created_at": w.created_at.isoformat()
-        })
-    return JsonResponse({"worksheets": out})
+    sheets = (Worksheet.objects.filter(user=user)
+              .select_related("content")
+              .only("id", "question", "created_at", "content__id", "content__title"))
+    return _page(request, sheets, "worksheets", lambda w: {
+        "id": w.id,
+        "content_id": w.content_id,
+        "title": w.content.title if w.content else "",
+        "question": w.question,
+        "created_at": w.created_at.isoformat()
+    })
 
 @csrf_exempt
 def my_studyplans(request):
+    """Plan summaries; the plan itself only with ?include=plan (or from
+    my_studyplans/<doc_id>/)."""
     if request.method != "GET":
         return JsonResponse({"error": "GET only"}, status=405)
     user = get_user_from_request(request)
     if not user:
         return JsonResponse({"error":"Unauthorized"}, status=401)
-    out = []
-    for cur in Curriculum.objects.filter(user=user).order_by("-created_at"):
-        out.append({
+    include_plan = request.GET.get("include") == "plan"
+    fields = ["id", "title", "duration", "created_at"] + (["study_plan"] if include_plan else [])
+    plans = Curriculum.objects.filter(user=user).only(*fields)
+
+    def serialize(cur):
+        out = {
             "id": cur.id,
             "title": cur.title,
             "duration": cur.duration,
-            "study_plan": cur.study_plan,
             "created_at": cur.created_at.isoformat()
-        })
-    return JsonResponse({"studyplans": out})
+        }
+        if include_plan:
+            out["study_plan"] = cur.study_plan
+        return out
+
+    return _page(request, plans, "studyplans", serialize)
+
+@csrf_exempt
+def my_studyplan(request, doc_id):
+    if request.method != "GET":
+        return JsonResponse({"error": "GET only"}, status=405)
+    user = get_user_from_request(request)
+    if not user:
+        return JsonResponse({"error":"Unauthorized"}, status=401)
+    cur = Curriculum.objects.filter(id=doc_id, user=user).only(
+        "id", "title", "duration", "study_plan", "created_at").first()
+    if not cur:
+        return JsonResponse({"error": "curriculum not found for user"}, status=404)
+    return etag_response(request, {
+        "id": cur.id,
+        "title": cur.title,
+        "duration": cur.duration,
+        "study_plan": cur.study_plan,
+        "created_at": cur.created_at.isoformat()
+    })